@@ -0,0 +1,300 @@
+# scripts/benchmark.py
+"""
+End-to-end pipeline benchmarks on fixed local fixtures.
+
+    python -m scripts.benchmark                    # run all stages, append to history, compare to baseline
+    python -m scripts.benchmark --save-baseline    # also store this run as the new baseline
+    python -m scripts.benchmark --stages chunk,query
+
+Every stage runs in a fresh (spawned) process so its peak RSS is measured in isolation.
+Stages whose dependencies are unavailable (tesseract binary, embedding / LoRA model files,
+i.e. OSError) are reported as skipped; any other exception is a stage error, and a stage
+that was ok in the baseline but isn't now counts as a regression.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# CONFIG
+HISTORY_PATH = "reports/bench_history.json"
+BASELINE_PATH = "reports/bench_baseline.json"
+FIXTURE_PDF_GLOB = "data/raw_notes/*.pdf"
+THRESHOLD = 0.20                # allowed relative regression vs baseline
+SYNTH_PARAGRAPHS = 4000         # synthetic corpus size (~1.5 MB of text)
+INDEX_CHUNKS = 512              # chunks embedded by the build_index stage
+QUERIES = ["Short Line Model", "Why did Margie hate school?", "mechanical teacher",
+           "old books printed on paper", "Surge Impedance Loading", "Tommy found a real book"]
+GENERATE_TOPICS = ["The Fun They Had"]
+REPEATS = 5
+
+_WORDS = ("line model voltage current impedance school teacher book paper screen margie tommy "
+          "capacitance resistance reactance surge loading power transmission student lesson "
+          "homework geography history mechanical inspector arithmetic fractions diary").split()
+
+
+def synthetic_corpus(paragraphs: int = SYNTH_PARAGRAPHS, seed: int = 0) -> str:
+    """Deterministic pseudo-lecture text with headings, prose paragraphs and a few LaTeX blocks."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(paragraphs):
+        if i % 25 == 0:
+            out.append(f"SECTION {i // 25 + 1}")
+        if i % 40 == 7:
+            out.append(f"The relation is $V_{{{i}}} = I Z + {rng.randint(1, 9)}$ for this case.")
+            continue
+        sents = []
+        for _ in range(rng.randint(2, 6)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 18))]
+            sents.append(" ".join(words).capitalize() + ".")
+        out.append(" ".join(sents))
+    return "\n\n".join(out)
+
+
+def _make_ocr_pdf(path: str, pages: int = 2):
+    """Image-only PDF (rendered text pages, no text layer) to exercise the OCR path."""
+    import fitz
+    src = fitz.open(sorted(glob.glob(FIXTURE_PDF_GLOB))[0])
+    out = fitz.open()
+    for i in range(pages):
+        pix = src[i % len(src)].get_pixmap(dpi=150)
+        page = out.new_page(width=src[i % len(src)].rect.width, height=src[i % len(src)].rect.height)
+        page.insert_image(page.rect, pixmap=pix)
+    out.save(path)
+
+
+def _summary(samples, units_per_sample: float = 1.0):
+    """Latency percentiles (seconds) and throughput (units/s) for per-call samples."""
+    s = sorted(samples)
+
+    def pct(p):
+        return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+    total = sum(s)
+    return {
+        "n": len(s),
+        "mean_s": total / len(s),
+        "p50_s": pct(50),
+        "p95_s": pct(95),
+        "p99_s": pct(99),
+        "stdev_s": statistics.pstdev(s),
+        "throughput": (units_per_sample * len(s) / total) if total else 0.0,
+    }
+
+
+def _timed(fn, repeats):
+    samples, result = [], None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, result
+
+
+# -----------------------
+# Stages (each runs inside its own spawned process)
+# -----------------------
+def stage_pdf_text(tmp):
+    from src.ingest import pdf_to_text
+    import fitz
+    pdfs = sorted(glob.glob(FIXTURE_PDF_GLOB))
+    pages = sum(len(fitz.open(p)) for p in pdfs)
+    samples, _ = _timed(lambda: [pdf_to_text(p, ocr_enabled=False) for p in pdfs], REPEATS)
+    return _summary(samples, pages), "pages/s"
+
+
+def stage_pdf_ocr(tmp):
+    import pytesseract
+    pytesseract.get_tesseract_version()  # raises if the binary is missing -> skipped
+    from src.ingest import pdf_to_text
+    path = os.path.join(tmp, "ocr_fixture.pdf")
+    _make_ocr_pdf(path)
+    samples, _ = _timed(lambda: pdf_to_text(path, ocr_enabled=True), 2)
+    return _summary(samples, 2), "pages/s"
+
+
+def stage_chunk(tmp):
+    from src.chunker import split_into_chunks
+    text = synthetic_corpus()
+    samples, _ = _timed(lambda: split_into_chunks(text), REPEATS)
+    return _summary(samples, len(text) / 1e6), "MB/s"
+
+
+def stage_build_index(tmp):
+    from src.chunker import split_into_chunks
+    from src.indexer import build_index
+    chunks = split_into_chunks(synthetic_corpus())[:INDEX_CHUNKS]
+    idx, meta = os.path.join(tmp, "bench.index"), os.path.join(tmp, "bench_meta.json")
+    samples, _ = _timed(lambda: build_index(chunks, index_path=idx, meta_path=meta), 2)
+    return _summary(samples, len(chunks)), "chunks/s"
+
+
+def stage_query(tmp):
+    from src.chunker import split_into_chunks
+    from src.indexer import build_index, query_index
+    idx, meta = os.path.join(tmp, "bench.index"), os.path.join(tmp, "bench_meta.json")
+    build_index(split_into_chunks(synthetic_corpus())[:INDEX_CHUNKS], index_path=idx, meta_path=meta)
+    samples = []
+    for _ in range(REPEATS):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            query_index(q, k=6, index_path=idx, meta_path=meta)
+            samples.append(time.perf_counter() - t0)
+    return _summary(samples), "queries/s"
+
+
+def stage_generate(tmp):
+    from src.chunker import split_into_chunks
+    from src import indexer, inference
+    # fixed fixture collection instead of whatever index/faiss.index is on disk
+    indexer.COLLECTIONS_DIR = os.path.join(tmp, "collections")
+    indexer.build_index(split_into_chunks(synthetic_corpus())[:INDEX_CHUNKS], collection="bench")
+    # every repeat must pay for retrieval, not hit the semantic cache
+    inference.SEMANTIC_CACHE = False
+    t0 = time.perf_counter()
+    inference.load_model(base_model=inference.BASE_MODEL, lora_dir=inference.LORA_DIR)
+    load_s = time.perf_counter() - t0
+    samples, _ = _timed(lambda: [inference.generate_study_guide(t, top_k=6, save=False, collection="bench")
+                                 for t in GENERATE_TOPICS], 2)
+    stats = _summary(samples, len(GENERATE_TOPICS))
+    stats["model_load_s"] = load_s
+    return stats, "guides/s"
+
+
+STAGES = {
+    "pdf_text": stage_pdf_text,
+    "pdf_ocr": stage_pdf_ocr,
+    "chunk": stage_chunk,
+    "build_index": stage_build_index,
+    "query": stage_query,
+    "generate": stage_generate,
+}
+
+
+def _run_stage(name):
+    """Child-process entry point: run one stage and report its metrics plus peak RSS."""
+    tmp = tempfile.mkdtemp(prefix="cheebo_bench_")
+    try:
+        stats, unit = STAGES[name](tmp)
+        stats["unit"] = unit
+        stats["status"] = "ok"
+    except OSError as e:
+        # missing tesseract binary (TesseractNotFoundError) or model / fixture files
+        stats = {"status": "skipped", "reason": f"{type(e).__name__}: {e}"}
+    except Exception as e:
+        stats = {"status": "error", "reason": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats["peak_rss_mb"] = rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return stats
+
+
+def run(stages):
+    results = {}
+    for name in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results[name] = pool.submit(_run_stage, name).result()
+        r = results[name]
+        if r["status"] == "ok":
+            print(f"{name:12s} p50={r['p50_s'] * 1000:9.2f}ms p95={r['p95_s'] * 1000:9.2f}ms "
+                  f"{r['throughput']:10.2f} {r['unit']:10s} rss={r['peak_rss_mb']:.0f}MB")
+        else:
+            print(f"{name:12s} {r['status']} ({r['reason']})")
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Return human-readable regressions of `results` versus the stored baseline."""
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get("stages", {}).get(name)
+        if not b or b.get("status") != "ok":
+            continue
+        if r.get("status") != "ok":
+            regressions.append(f"{name}: ok in baseline, now {r.get('status')} ({r.get('reason')})")
+            continue
+        if r["p50_s"] > b["p50_s"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {b['p50_s']:.4f}s -> {r['p50_s']:.4f}s")
+        if r["throughput"] < b["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {b['throughput']:.2f} -> {r['throughput']:.2f} {r['unit']}")
+        if r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {b['peak_rss_mb']:.0f}MB -> {r['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def _load_json(path, default):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return default
+
+
+def _write_json(path, obj):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark every pipeline stage and track regressions.")
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument("--history", default=HISTORY_PATH)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        sys.exit(f"Unknown stages: {unknown}")
+
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "stages": run(stages),
+    }
+    history = _load_json(args.history, [])
+    history.append(entry)
+    _write_json(args.history, history)
+
+    errored = [n for n, r in entry["stages"].items() if r["status"] == "error"]
+    if errored:
+        # a crashing stage is a bug, never a baseline
+        print(f"\nStage errors: {', '.join(errored)}")
+        for n in errored:
+            print(entry["stages"][n]["traceback"])
+        sys.exit(1)
+
+    baseline = _load_json(args.baseline, None)
+    if args.save_baseline or baseline is None:
+        _write_json(args.baseline, entry)
+        print("Saved baseline:", args.baseline)
+        return
+
+    regressions = compare(entry["stages"], baseline, args.threshold)
+    if regressions:
+        print(f"\nREGRESSIONS (> {args.threshold:.0%} vs baseline {baseline['timestamp']}):")
+        for r in regressions:
+            print("  -", r)
+        sys.exit(1)
+    print(f"\nNo regressions vs baseline {baseline['timestamp']}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 import os
 from src.ingest import pdf_to_text
 from src.chunker import split_into_chunks
-from src.indexer import build_index  # assumes you have a function to build index from chunks
+from src.indexer import build_index
 from src.inference import generate_study_guide
 
 pdf_path = "data/raw_notes/Lecture_16.pdf"  # change to your PDF
@@ -11,12 +11,11 @@ topic = "Short Line Model"                  # topic to generate for
 # extract text
 text = pdf_to_text(pdf_path)
 
-# chunk & build a temporary index (index/temp.index, index/temp_meta.json)
+# chunk & build a per-document collection (index/collections/<pdf name>/)
+collection = os.path.splitext(os.path.basename(pdf_path))[0]
 chunks = split_into_chunks(text)
-build_index(chunks, index_path="index/temp.index", meta_path="index/temp_meta.json")
+build_index(chunks, collection=collection)
 
-# generate using the temp index (your query_index should read from temp index if implemented)
-# if query_index defaults to index/faiss.index, either modify query_index to take index path,
-# or replace the global index files with temp files temporarily.
-out = generate_study_guide(topic, top_k=6)
+# generate against that collection; the global index/faiss.index is left untouched
+out = generate_study_guide(topic, top_k=6, collection=collection)
 print(out)
@@ -0,0 +1,108 @@
+# scripts/tune_threads.py
+"""
+Sweep per-stage CPU thread budgets (see src/runtime.py) and report the fastest setting.
+
+    python -m scripts.tune_threads                      # sweep every stage, print the table
+    python -m scripts.tune_threads --stages index --threads 1,2,4
+    python -m scripts.tune_threads --write              # store the best budgets in data/runtime.json
+
+Each (stage, threads) point re-runs the matching scripts/benchmark.py workloads in a fresh
+spawned process with CHEEBO_THREADS set, so library thread pools are sized from scratch.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from scripts.benchmark import _run_stage
+from src import runtime
+
+# runtime stage -> benchmark workloads it governs
+WORKLOADS = {
+    "ingest": ["pdf_ocr", "pdf_text"],
+    "index": ["build_index", "query"],
+    "inference": ["generate"],
+}
+
+
+def default_sweep(cpus: int):
+    """1, 2, 4, ... up to (and including) the number of usable CPUs."""
+    points, n = [], 1
+    while n < cpus:
+        points.append(n)
+        n *= 2
+    return points + [cpus]
+
+
+def measure(stage: str, threads: int):
+    """Throughput of every workload of `stage` with `threads` threads (None when skipped)."""
+    os.environ[runtime.THREADS_ENV] = f"{stage}={threads}"
+    out = {}
+    for bench in WORKLOADS[stage]:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            r = pool.submit(_run_stage, bench).result()
+        out[bench] = r if r["status"] == "ok" else None
+    return out
+
+
+def tune(stages, sweep):
+    best = {}
+    for stage in stages:
+        rows = []
+        for n in sweep:
+            res = measure(stage, n)
+            ok = {b: r for b, r in res.items() if r}
+            if not ok:
+                print(f"{stage:10s} threads={n:<3d} skipped (no runnable workload)")
+                break
+            rows.append((n, ok))
+            cols = "  ".join(f"{b}={r['throughput']:.2f} {r['unit']}" for b, r in ok.items())
+            print(f"{stage:10s} threads={n:<3d} {cols}")
+        if not rows:
+            continue
+        # score each setting by its throughput relative to the best seen per workload, averaged,
+        # so a stage with two workloads isn't dominated by the one with bigger numbers
+        peak = {b: max(r[b]["throughput"] for _, r in rows if b in r) for b in rows[0][1]}
+        scored = [(sum(r[b]["throughput"] / peak[b] for b in peak if b in r) / len(peak), n) for n, r in rows]
+        score, n = max(scored)
+        best[stage] = n
+        print(f"{stage:10s} best threads={n} ({score:.0%} of per-workload peak)\n")
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Find the best CPU thread budget per pipeline stage.")
+    ap.add_argument("--stages", default=",".join(WORKLOADS), help="comma-separated subset of: " + ", ".join(WORKLOADS))
+    ap.add_argument("--threads", default=None, help="comma-separated thread counts (default: 1,2,4,...,cpus)")
+    ap.add_argument("--write", action="store_true", help=f"save the best budgets to {runtime.RUNTIME_PATH}")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in WORKLOADS]
+    if unknown:
+        sys.exit(f"Unknown stages: {unknown}")
+    cpus = runtime.cpu_count()
+    sweep = [int(x) for x in args.threads.split(",")] if args.threads else default_sweep(cpus)
+    # budgets are clamped to the usable CPUs, so larger points would just repeat the last one
+    sweep = sorted({min(max(1, n), cpus) for n in sweep})
+
+    best = tune(stages, sweep)
+    print("Best budgets:", json.dumps(best))
+    if args.write and best:
+        current = {}
+        if os.path.exists(runtime.RUNTIME_PATH):
+            with open(runtime.RUNTIME_PATH, "r", encoding="utf-8") as f:
+                current = json.load(f)
+        current.setdefault("threads", {}).update(best)
+        current.update({"cpus": cpus, "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        os.makedirs(os.path.dirname(runtime.RUNTIME_PATH) or ".", exist_ok=True)
+        with open(runtime.RUNTIME_PATH, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print("Saved:", runtime.RUNTIME_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# src/adapters.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+
+from peft import PeftModel
+
+from src import tracing
+
+# CONFIG
+MODELS_ROOT = "models"
+ADAPTER_MEMORY_MB = 256      # cap on resident LoRA weights (the base model is not counted)
+MAX_ADAPTERS = 16
+
+
+def adapter_name(lora_dir: str) -> str:
+    """Stable PEFT adapter name for an adapter folder (PEFT names may not contain '.')."""
+    rel = os.path.relpath(os.path.normpath(lora_dir), MODELS_ROOT)
+    if rel.startswith(".."):
+        rel = os.path.normpath(lora_dir)
+    return re.sub(r"[^0-9A-Za-z_]+", "_", rel).strip("_") or "adapter"
+
+
+def discover_adapters(root: str = MODELS_ROOT) -> Dict[str, str]:
+    """Find LoRA adapter folders (those with adapter_config.json) under `root`, skipping checkpoints."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("checkpoint-"))
+        if "adapter_config.json" in filenames:
+            found[adapter_name(dirpath)] = dirpath
+    return found
+
+
+class AdapterRegistry:
+    """
+    One resident base model with many hot-swappable LoRA adapters (one per course).
+    Adapters are loaded on first use, switched with set_adapter (no weight copies), and the
+    least recently used ones are deleted when their total size exceeds `max_bytes`.
+    All adapters must have been trained with the same tokenizer (same added tokens).
+    """
+
+    def __init__(self, base, max_bytes: int = ADAPTER_MEMORY_MB * 1024 * 1024, max_adapters: int = MAX_ADAPTERS):
+        self.base = base
+        self.model = None           # PeftModel wrapping `base`, created with the first adapter
+        self.max_bytes = max_bytes
+        self.max_adapters = max_adapters
+        self.active = None
+        self._lru = OrderedDict()   # name -> {"path", "bytes"}
+        self.lock = threading.RLock()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "switches": 0}
+
+    def _adapter_bytes(self, name: str) -> int:
+        marker = f".{name}."
+        return sum(p.numel() * p.element_size() for n, p in self.model.named_parameters() if marker in n)
+
+    def _load(self, name: str, lora_dir: str):
+        with tracing.span("adapters.load", adapter=name):
+            if self.model is None:
+                self.model = PeftModel.from_pretrained(self.base, lora_dir, adapter_name=name)
+            else:
+                self.model.load_adapter(lora_dir, adapter_name=name)
+        self.model.eval()
+        self._lru[name] = {"path": lora_dir, "bytes": self._adapter_bytes(name)}
+        self.stats["loads"] += 1
+
+    def _evict(self, keep: str):
+        total = sum(a["bytes"] for a in self._lru.values())
+        while len(self._lru) > 1 and (total > self.max_bytes or len(self._lru) > self.max_adapters):
+            victim = next(n for n in self._lru if n != keep)
+            total -= self._lru.pop(victim)["bytes"]
+            self.model.delete_adapter(victim)
+            self.stats["evictions"] += 1
+
+    def activate(self, lora_dir: str):
+        """Make the adapter in `lora_dir` the active one (loading it if needed); returns the model."""
+        name = adapter_name(lora_dir)
+        with self.lock:
+            if name in self._lru:
+                self._lru.move_to_end(name)
+                self.stats["hits"] += 1
+                tracing.count("adapter_cache_hit")
+            else:
+                self._load(name, lora_dir)
+                self._evict(keep=name)
+                tracing.count("adapter_cache_miss")
+            if self.active != name:
+                t0 = time.perf_counter()
+                self.model.set_adapter(name)
+                self.active = name
+                self.stats["switches"] += 1
+                self.stats["last_switch_ms"] = (time.perf_counter() - t0) * 1000
+            return self.model
+
+    @contextmanager
+    def use(self, lora_dir: str):
+        """Hold the registry lock while generating so concurrent callers can't swap the adapter."""
+        with self.lock:
+            yield self.activate(lora_dir)
+
+    def loaded(self) -> Dict[str, dict]:
+        return {n: dict(a) for n, a in self._lru.items()}
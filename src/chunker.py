@@ -1,6 +1,6 @@
 # src/chunker.py
 import re
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 SENTENCE_END = re.compile(r'(?<=[\.\?\!])\s+')
 
@@ -67,24 +67,21 @@ def normalize_paragraphs(text: str) -> List[str]:
     return paras
 
 
-def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200) -> List[str]:
+def _chunk_paragraphs(paragraphs: List[str], max_chars: int = 1500, overlap_chars: int = 200) -> List[Tuple[str, int, int]]:
     """
-    Main chunker:
-    - normalize paragraphs
-    - keep LaTeX paragraphs intact
-    - try to keep headings attached to following paragraph
-    - use sentence-aware overlap (not raw character overlap)
+    Core chunking over normalized paragraphs. Returns (chunk_text, first_para, last_para) so
+    callers can map chunks back to paragraph metadata (pages, headings).
     """
-    paragraphs = normalize_paragraphs(text)
     chunks = []
     cur = ""
+    first = last = 0
 
     def flush_current():
         nonlocal cur
         if cur.strip():
             # cleanup multiple newlines
             c = re.sub(r'\n{3,}','\n\n', cur.strip())
-            chunks.append(c)
+            chunks.append((c, first, last))
             cur = ""
 
     for i, p in enumerate(paragraphs):
@@ -92,11 +89,15 @@ def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200
         if is_heading(p):
             # if current chunk non-empty and small enough, append heading to it
             if not cur or len(cur) + len(p) + 2 <= max_chars:
+                if not cur:
+                    first = i
                 cur = cur + ("\n\n" + p if cur else p)
+                last = i
                 continue
             else:
                 flush_current()
                 cur = p
+                first = last = i
                 continue
 
         # if paragraph has LaTeX, never split inside — treat as a block
@@ -108,10 +109,13 @@ def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200
             if len(p) > max_chars:
                 # split by sentences but keep latex spans intact (do not split inside $...$)
                 flush_current()
-                chunks.append(p)
+                chunks.append((p, i, i))
                 cur = ""
             else:
+                if not cur:
+                    first = i
                 cur += ("\n\n" + p) if cur else p
+                last = i
                 # if cur now too large, flush
                 if len(cur) > max_chars:
                     flush_current()
@@ -120,8 +124,10 @@ def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200
         # normal paragraph: try to append
         if not cur:
             cur = p
+            first = last = i
         elif len(cur) + len(p) + 2 <= max_chars:
             cur += "\n\n" + p
+            last = i
         else:
             # need to flush: create overlap by taking last few sentences from cur
             # sentence-aware overlap
@@ -136,20 +142,62 @@ def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200
                 if len(candidate) > overlap_chars:
                     break
                 overlap_text = candidate
+            prev_last = last
             flush_current()
             # start new chunk with overlap + current paragraph
             if overlap_text:
                 cur = overlap_text + "\n\n" + p
+                first = prev_last
             else:
                 cur = p
+                first = i
+            last = i
 
     # final flush
     if cur.strip():
-        chunks.append(re.sub(r'\n{3,}', '\n\n', cur.strip()))
+        chunks.append((re.sub(r'\n{3,}', '\n\n', cur.strip()), first, last))
 
     # final cleanup: trim leading/trailing whitespace & filter tiny chunks
-    cleaned = [c.strip() for c in chunks if len(c.strip()) > 30]
-    return cleaned
+    return [(c.strip(), f, l) for c, f, l in chunks if len(c.strip()) > 30]
+
+
+def split_into_chunks(text: str, max_chars: int = 1500, overlap_chars: int = 200) -> List[str]:
+    """
+    Main chunker:
+    - normalize paragraphs
+    - keep LaTeX paragraphs intact
+    - try to keep headings attached to following paragraph
+    - use sentence-aware overlap (not raw character overlap)
+    """
+    paragraphs = normalize_paragraphs(text)
+    return [c for c, _, _ in _chunk_paragraphs(paragraphs, max_chars, overlap_chars)]
+
+
+def split_pages_into_chunks(pages: List[str], max_chars: int = 1500, overlap_chars: int = 200) -> List[Dict]:
+    """
+    Chunk a document given as per-page texts and attach structured metadata:
+        {"text", "pages": [first_page, last_page] (1-based), "heading": nearest heading or None}
+    The heading is the last is_heading() paragraph at or before the chunk's first paragraph.
+    """
+    paragraphs, para_pages = [], []
+    for page_no, page_text in enumerate(pages, 1):
+        for p in normalize_paragraphs(page_text):
+            paragraphs.append(p)
+            para_pages.append(page_no)
+    headings, current = [], None
+    for p in paragraphs:
+        if is_heading(p):
+            current = p.rstrip(":").strip()
+        headings.append(current)
+
+    out = []
+    for text, first, last in _chunk_paragraphs(paragraphs, max_chars, overlap_chars):
+        out.append({
+            "text": text,
+            "pages": [para_pages[first], para_pages[last]],
+            "heading": headings[first],
+        })
+    return out
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+# src/dedup.py
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# CONFIG
+NUM_PERM = 64             # MinHash signature length
+BANDS = 16                # LSH bands (NUM_PERM must be divisible by BANDS)
+SHINGLE_SIZE = 5          # word shingles
+DUP_THRESHOLD = 0.8       # estimated Jaccard above which two chunks are near-duplicates
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SOURCE_PREFIX = re.compile(r"^Source:\s*(.+?)\n\n", flags=re.DOTALL)
+
+
+def split_source_prefix(chunk: str) -> Tuple[Optional[str], str]:
+    """Split the 'Source: <fname>' prefix added by make_index.py off a chunk."""
+    m = _SOURCE_PREFIX.match(chunk)
+    if not m:
+        return None, chunk
+    return m.group(1).strip(), chunk[m.end():]
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Hash word shingles of the normalized text to 32-bit ints."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams]
+    return np.array(hashes, dtype=np.uint64)
+
+
+def _permutations(num_perm: int = NUM_PERM, seed: int = 1):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(text: str, perms=None) -> np.ndarray:
+    """MinHash signature (length NUM_PERM) of a chunk's word shingles."""
+    a, b = perms if perms is not None else _permutations()
+    hv = _shingles(text)
+    if hv.size == 0:
+        return np.full(a.shape[0], _MAX_HASH, dtype=np.uint64)
+    # (a * h + b) mod p, one row per shingle; uint64 wraparound is accepted (as in datasketch)
+    with np.errstate(over="ignore"):
+        phv = ((np.outer(hv, a) + b) % _MERSENNE_PRIME) & _MAX_HASH
+    return phv.min(axis=0)
+
+
+def find_duplicate_groups(chunks: List[str], threshold: float = DUP_THRESHOLD,
+                          num_perm: int = NUM_PERM, bands: int = BANDS) -> List[List[int]]:
+    """
+    Cluster near-duplicate chunks with MinHash + LSH banding.
+    Only chunks sharing at least one band bucket are compared, so this is ~linear in len(chunks).
+    Returns groups of original indices (each group sorted, groups ordered by first member).
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+    perms = _permutations(num_perm)
+    texts = [split_source_prefix(c)[1] for c in chunks]
+    sigs = [minhash(t, perms) for t in texts]
+    # chunks without any word tokens all get the same sentinel signature; keep them out of LSH
+    # so each stays its own group instead of being merged with every other such chunk
+    hashable = [_shingles(t).size > 0 for t in texts]
+
+    # union-find over chunk indices
+    parent = list(range(len(chunks)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    for i, sig in enumerate(sigs):
+        if not hashable[i]:
+            continue
+        for band in range(bands):
+            key = (band, sig[band * rows:(band + 1) * rows].tobytes())
+            buckets.setdefault(key, []).append(i)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # compare each member with one representative per cluster already seen in this bucket,
+        # joining the first that passes; a member matching none starts a new cluster
+        reps = [members[0]]
+        for j in members[1:]:
+            for r in reps:
+                ri, rj = find(r), find(j)
+                if ri == rj:
+                    break
+                # verify candidate pair with the estimated Jaccard similarity
+                if float(np.mean(sigs[r] == sigs[j])) >= threshold:
+                    parent[max(ri, rj)] = min(ri, rj)
+                    break
+            else:
+                reps.append(j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(chunks)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values(), key=lambda g: g[0])
+
+
+def dedup_chunks(chunks: List[str], threshold: float = DUP_THRESHOLD, sources: Optional[List[Optional[str]]] = None):
+    """
+    Collapse near-duplicate chunks, keeping one representative per group (the longest one).
+    `sources` gives each chunk's source file; by default it is read from the 'Source:' prefix.
+    Returns (kept_chunks, groups, stats) where groups[i] describes kept_chunks[i]:
+        {"representative": original index, "members": [original indices], "sources": [source file names]}
+    """
+    if sources is None:
+        sources = [split_source_prefix(c)[0] for c in chunks]
+    groups = find_duplicate_groups(chunks, threshold=threshold)
+    kept, described = [], []
+    for members in groups:
+        rep = max(members, key=lambda i: len(chunks[i]))
+        srcs = []
+        for i in members:
+            if sources[i] and sources[i] not in srcs:
+                srcs.append(sources[i])
+        kept.append(chunks[rep])
+        described.append({"representative": rep, "members": members, "sources": srcs})
+
+    bytes_before = sum(len(c.encode("utf-8")) for c in chunks)
+    bytes_after = sum(len(c.encode("utf-8")) for c in kept)
+    stats = {
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept),
+        "removed": len(chunks) - len(kept),
+        "text_bytes_before": bytes_before,
+        "text_bytes_after": bytes_after,
+        "saved_ratio": (1 - len(kept) / len(chunks)) if chunks else 0.0,
+    }
+    return kept, described, stats
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    if os.path.exists("index/meta.json"):
+        with open("index/meta.json", "r", encoding="utf-8") as f:
+            chunks = [m["text"] if isinstance(m, dict) else m for m in json.load(f)]
+        _, _, stats = dedup_chunks(chunks)
+        print(json.dumps(stats, indent=2))
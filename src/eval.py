@@ -1,17 +1,196 @@
-import json, glob, re, os
-from evaluate import load
-rouge = load("rouge")
-def slug(s): return re.sub(r'[^a-z0-9]+','', s.lower())
-gold = {slug(os.path.basename(p).replace('.json','')):p for p in glob.glob('data/gold_examples/*.json')}
-pred = {slug(os.path.basename(p).replace('.json','')):p for p in glob.glob('outputs_fixed/*.json')}
-common = set(gold.keys()) & set(pred.keys())
-print("common:", common)
-gs=[]; ps=[]
-for k in sorted(common):
-    g=json.load(open(gold[k],'r',encoding='utf-8')); p=json.load(open(pred[k],'r',encoding='utf-8'))
-    gs.append(g.get('summary','')); ps.append(p.get('summary',''))
-if gs:
-    r = rouge.compute(predictions=ps, references=gs)
-    print("ROUGE result:", r)
-else:
-    print("No summaries")
+# src/eval.py
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rouge_score import rouge_scorer
+
+# CONFIG
+GOLD_DIR = "data/gold_examples"
+PRED_DIR = "outputs_fixed"
+CACHE_PATH = "data/cache/eval_scores.json"
+REPORT_PATH = "reports/eval_report.json"
+METRIC_VERSION = "v1"      # bump when scoring changes (invalidates cached scores)
+LIST_FIELDS = {            # list field -> key holding the text to match
+    "key_points": None,
+    "important_questions": "q",
+    "solved_examples": "question",
+}
+
+_SCORER = None
+
+
+def slug(s):
+    return re.sub(r'[^a-z0-9]+', '', s.lower())
+
+
+def _init_worker():
+    global _SCORER
+    _SCORER = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
+
+
+def _text(item, key):
+    if key is None or not isinstance(item, dict):
+        return item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+    return str(item.get(key, ""))
+
+
+def _best_match_f1(golds, preds):
+    """Greedy soft matching of two string lists: each item counts its best ROUGE-L F with the other side."""
+    if not golds and not preds:
+        return {"precision": 1.0, "recall": 1.0, "f1": 1.0}
+    if not golds or not preds:
+        return {"precision": 0.0, "recall": 0.0, "f1": 0.0}
+    sims = [[_SCORER.score(g, p)["rougeL"].fmeasure for p in preds] for g in golds]
+    recall = sum(max(row) for row in sims) / len(golds)
+    precision = sum(max(sims[i][j] for i in range(len(golds))) for j in range(len(preds))) / len(preds)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def _latex_key(s):
+    return re.sub(r"\s+", "", s or "")
+
+
+def score_pair(gold, pred):
+    """Score every schema field of one predicted study guide against its gold example."""
+    if _SCORER is None:
+        _init_worker()
+    scores = {}
+    s = _SCORER.score(gold.get("summary", "") or "", pred.get("summary", "") or "")
+    scores["summary"] = {k: v.fmeasure for k, v in s.items()}
+    for field, key in LIST_FIELDS.items():
+        golds = [_text(x, key) for x in gold.get(field, []) or []]
+        preds = [_text(x, key) for x in pred.get(field, []) or []]
+        scores[field] = _best_match_f1(golds, preds)
+    # formulas: exact match on whitespace-normalized LaTeX
+    g = {_latex_key(f.get("latex")) for f in gold.get("formulas", []) or [] if isinstance(f, dict)}
+    p = {_latex_key(f.get("latex")) for f in pred.get("formulas", []) or [] if isinstance(f, dict)}
+    hit = len(g & p)
+    prec = hit / len(p) if p else float(not g)
+    rec = hit / len(g) if g else float(not p)
+    scores["formulas"] = {"precision": prec, "recall": rec, "f1": 2 * prec * rec / (prec + rec) if prec + rec else 0.0}
+    scores["valid_schema"] = "raw_output" not in pred
+    return scores
+
+
+def _score_files(args):
+    """Score one (gold, pred) pair; any per-pair problem becomes {"error"} so the pool survives."""
+    key, gold_path, pred_path = args
+    docs = {}
+    for name, path in (("gold", gold_path), ("pred", pred_path)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                docs[name] = json.load(f)
+        except Exception as e:
+            return key, {"error": f"{name}: {e}"}
+        if not isinstance(docs[name], dict):
+            return key, {"error": f"{name}: expected a JSON object, got {type(docs[name]).__name__}"}
+    try:
+        return key, score_pair(docs["gold"], docs["pred"])
+    except Exception as e:
+        # e.g. a field with the wrong type ("formulas": 3)
+        return key, {"error": f"{type(e).__name__}: {e}"}
+
+
+def _content_hash(*paths):
+    h = hashlib.sha256(METRIC_VERSION.encode("utf-8"))
+    for p in paths:
+        with open(p, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _load_cache(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+
+def evaluate_dir(pred_dir=PRED_DIR, gold_dir=GOLD_DIR, workers=None, cache_path=CACHE_PATH, report_path=REPORT_PATH):
+    """
+    Score outputs against gold by slug, in parallel worker processes.
+    Per-pair scores are cached by the hash of (gold, pred) contents, so reruns only score changed files.
+    Writes a JSON report with per-file scores and per-field means, and returns it.
+    """
+    t0 = time.perf_counter()
+    gold = {slug(os.path.basename(p).replace('.json', '')): p for p in glob.glob(os.path.join(gold_dir, '*.json'))}
+    pred = {slug(os.path.basename(p).replace('.json', '')): p for p in glob.glob(os.path.join(pred_dir, '*.json'))}
+    common = sorted(set(gold) & set(pred))
+
+    cache = _load_cache(cache_path)
+    results, todo, hashes = {}, [], {}
+    for k in common:
+        try:
+            hashes[k] = _content_hash(gold[k], pred[k])
+        except OSError as e:
+            results[k] = {"error": str(e)}
+            continue
+        if hashes[k] in cache:
+            results[k] = cache[hashes[k]]
+        else:
+            todo.append((k, gold[k], pred[k]))
+
+    if todo:
+        if workers == 1 or len(todo) == 1:
+            scored = list(map(_score_files, todo))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                scored = list(pool.map(_score_files, todo, chunksize=max(1, len(todo) // 32)))
+        for k, sc in scored:
+            results[k] = sc
+            if "error" not in sc:
+                cache[hashes[k]] = sc
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+
+    # per-field means over successfully scored files
+    ok = [r for r in results.values() if "error" not in r]
+    means = {}
+    if ok:
+        means["summary"] = {m: sum(r["summary"][m] for r in ok) / len(ok) for m in ok[0]["summary"]}
+        for field in list(LIST_FIELDS) + ["formulas"]:
+            means[field] = {m: sum(r[field][m] for r in ok) / len(ok) for m in ("precision", "recall", "f1")}
+        means["valid_schema"] = sum(r["valid_schema"] for r in ok) / len(ok)
+
+    report = {
+        "pred_dir": pred_dir,
+        "gold_dir": gold_dir,
+        "metric_version": METRIC_VERSION,
+        "n_files": len(common),
+        "n_scored": len(todo),
+        "n_errors": sum("error" in r for r in results.values()),
+        "n_cached": len(common) - len(todo) - sum(k not in hashes for k in common),
+        "seconds": time.perf_counter() - t0,
+        "mean": means,
+        "files": {k: {"gold": gold[k], "pred": pred[k], "scores": results[k]} for k in common},
+    }
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Score generated study guides against gold examples.")
+    ap.add_argument("--pred-dir", default=PRED_DIR)
+    ap.add_argument("--gold-dir", default=GOLD_DIR)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--report", default=REPORT_PATH)
+    args = ap.parse_args()
+    rep = evaluate_dir(args.pred_dir, args.gold_dir, workers=args.workers, report_path=args.report)
+    print("common:", sorted(rep["files"]))
+    print(f"scored {rep['n_scored']}, cached {rep['n_cached']} in {rep['seconds']:.2f}s")
+    print(json.dumps(rep["mean"], indent=2))
+    print("Report:", args.report)
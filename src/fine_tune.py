@@ -1,16 +1,21 @@
 # src/fine_tune.py
+import hashlib
+import inspect
 import os
-from datasets import load_dataset
+import numpy as np
+from datasets import Dataset, load_dataset, load_from_disk
+from datasets.fingerprint import Hasher
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     Trainer,
     TrainingArguments,
-    DataCollatorForLanguageModeling,
 )
 from peft import LoraConfig, get_peft_model
 import torch
 
+from src.prompts import TEMPLATE_ID, format_example
+
 # -----------------------
 # CONFIG - adjust these
 # -----------------------
@@ -18,6 +23,16 @@ MODEL_REF = "gpt2"          # lightweight example. Change if you prefer another
 OUT_DIR = "models/lora"
 JSONL_PATH = "data/gold_examples/train.jsonl"
 MAX_LENGTH = 1024
+# "pad"    -> every example padded to MAX_LENGTH (original behaviour)
+# "pack"   -> examples bin-packed into MAX_LENGTH rows, positions reset per example
+# "bucket" -> no padding at tokenization, dynamic padding per batch + length-grouped batches
+SEQ_MODE = "pack"
+BUCKET_BATCH_SIZE = 4
+# tokenized datasets are cached here (Arrow, memory-mapped on load) and reused across runs
+CACHE_DIR = "data/cache/tokenized"
+PROMPT_TAIL_TOKENS = 16     # prompt tokens kept from the end (marker) when truncating
+# bump whenever tokenize_example / preprocess change, so cached tokenized datasets are rebuilt
+PREPROCESS_VERSION = "1"
 # -----------------------
 
 def load_jsonl(path):
@@ -25,58 +40,191 @@ def load_jsonl(path):
         raise FileNotFoundError(f"{path} not found. Create your train.jsonl first.")
     return load_dataset("json", data_files=path)["train"]
 
-def preprocess(dataset, tokenizer, max_length=MAX_LENGTH):
+def tokenize_example(tokenizer, instr, inp, out, max_length=MAX_LENGTH):
+    """
+    Tokenize one example with the shared template. Returns (input_ids, labels) where the
+    prompt tokens are masked with -100 so loss is only taken on the output (+ EOS).
+    Over-long prompts are cut in the middle so the instruction head and marker tail survive.
+    """
+    prompt, completion = format_example(instr, inp, out)
+    p = tokenizer(prompt, add_special_tokens=False)["input_ids"]
+    c = tokenizer(completion, add_special_tokens=False)["input_ids"] + [tokenizer.eos_token_id]
+    c = c[:max_length - 1]
+    keep = max_length - len(c)
+    if len(p) > keep:
+        tail = min(PROMPT_TAIL_TOKENS, keep // 2)
+        p = p[:keep - tail] + (p[-tail:] if tail else [])
+    return p + c, [-100] * len(p) + c
+
+def preprocess(dataset, tokenizer, max_length=MAX_LENGTH, padding="max_length"):
     """
     expects examples with keys: 'instruction','input','output'
     returns tokenized dict with 'input_ids', 'attention_mask', 'labels'
+    padding=False leaves examples at their natural length (for packing / dynamic padding).
     """
     def fn(examples):
-        inputs = []
-        for instr, inp, out in zip(
-            examples.get("instruction", []),
-            examples.get("input", []),
-            examples.get("output", []),
-        ):
-            # Build the textual example seen by the model during training.
-            # Keep formatting consistent with your inference prompt style.
-            text = instr.strip() + "\n" + inp.strip() + "\n\n" + out.strip()
-            inputs.append(text)
-
-        # Tokenize the batch
-        tok = tokenizer(
-            inputs,
-            truncation=True,
-            padding="max_length",
-            max_length=max_length,
-        )
-
-        # For causal LM, labels == input_ids but mask pad tokens with -100
-        labels = []
-        for ids in tok["input_ids"]:
-            lab = ids.copy()
-            # mask padding tokens
-            lab = [(-100 if (token == tokenizer.pad_token_id) else token) for token in lab]
-            labels.append(lab)
-
-        tok["labels"] = labels
-        return tok
+        rows = [
+            tokenize_example(tokenizer, instr, inp, out, max_length=max_length)
+            for instr, inp, out in zip(
+                examples.get("instruction", []),
+                examples.get("input", []),
+                examples.get("output", []),
+            )
+        ]
+        if not padding:
+            return {
+                "input_ids": [ids for ids, _ in rows],
+                "attention_mask": [[1] * len(ids) for ids, _ in rows],
+                "labels": [labs for _, labs in rows],
+            }
+
+        # pad to max_length; padding positions are masked in attention_mask and labels
+        lengths = np.array([len(ids) for ids, _ in rows])
+        filled = np.arange(max_length)[None, :] < lengths[:, None]
+        input_ids = np.full((len(rows), max_length), tokenizer.pad_token_id, dtype=np.int64)
+        labels = np.full((len(rows), max_length), -100, dtype=np.int64)
+        input_ids[filled] = np.concatenate([ids for ids, _ in rows]) if rows else []
+        labels[filled] = np.concatenate([labs for _, labs in rows]) if rows else []
+        return {"input_ids": input_ids, "attention_mask": filled.astype(np.int64), "labels": labels}
 
     tokenized = dataset.map(fn, batched=True, remove_columns=dataset.column_names)
     return tokenized
 
-def train(jsonl_path=JSONL_PATH, out_dir=OUT_DIR):
+def tokenized_cache_key(jsonl_path, tokenizer, max_length, padding):
+    """Key tokenized data by input file contents, tokenizer, template, preprocessing version and truncation settings."""
+    h = hashlib.sha256()
+    with open(jsonl_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(Hasher.hash(tokenizer).encode("utf-8"))
+    h.update(f"{TEMPLATE_ID}|{PREPROCESS_VERSION}|{PROMPT_TAIL_TOKENS}|{max_length}|{padding}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def load_tokenized(jsonl_path, tokenizer, max_length=MAX_LENGTH, padding="max_length", cache_dir=CACHE_DIR):
+    """
+    Tokenize train.jsonl once and reuse the result: the Arrow dataset is saved under
+    cache_dir/<key> and memory-mapped by load_from_disk on later runs. Any change to the
+    file, tokenizer, template or max_length produces a new key (i.e. invalidates the cache).
+    """
+    if not os.path.exists(jsonl_path):
+        raise FileNotFoundError(f"{jsonl_path} not found. Create your train.jsonl first.")
+    key = tokenized_cache_key(jsonl_path, tokenizer, max_length, padding)
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, "dataset_info.json")):
+        print("Using cached tokenized dataset:", path)
+        return load_from_disk(path)
+    tokenized = preprocess(load_jsonl(jsonl_path), tokenizer, max_length=max_length, padding=padding)
+    tokenized.save_to_disk(path)
+    return load_from_disk(path)
+
+def pack_dataset(tokenized, max_length=MAX_LENGTH):
+    """
+    Bin-pack unpadded examples (first-fit decreasing) into rows of at most max_length tokens.
+    Examples are never split across rows. position_ids restart at 0 for every example and the
+    first label of each packed example is masked, so no loss is computed across boundaries;
+    make_pad_collator turns the restarting position_ids into a block-diagonal attention mask.
+    """
+    examples = sorted(
+        zip(tokenized["input_ids"], tokenized["labels"]), key=lambda ex: len(ex[0]), reverse=True
+    )
+    bins = []   # each bin: [input_ids, labels, position_ids]
+    for ids, labs in examples:
+        ids, labs = ids[:max_length], labs[:max_length]
+        for b in bins:
+            if len(b[0]) + len(ids) <= max_length:
+                break
+        else:
+            b = [[], [], []]
+            bins.append(b)
+        b[0].extend(ids)
+        b[1].extend([-100] + list(labs[1:]))
+        b[2].extend(range(len(ids)))
+    return Dataset.from_dict({
+        "input_ids": [b[0] for b in bins],
+        "attention_mask": [[1] * len(b[0]) for b in bins],
+        "labels": [b[1] for b in bins],
+        "position_ids": [b[2] for b in bins],
+    })
+
+def packed_attention_mask(position_ids):
+    """
+    Additive 4D (batch, 1, seq, seq) causal mask that is block-diagonal over packed examples.
+    A new example starts wherever position_ids restart at 0, so tokens never attend to an
+    earlier example in the same row (resetting position_ids alone doesn't do that: a 2D
+    all-ones attention_mask still lets every token see the whole row). Padded tail positions
+    are 0 too, so each pad token only attends to itself.
+    """
+    seg = torch.cumsum((position_ids == 0).long(), dim=1)
+    n = position_ids.shape[1]
+    causal = torch.tril(torch.ones(n, n, dtype=torch.bool))
+    allowed = causal[None] & (seg[:, :, None] == seg[:, None, :])
+    mask = torch.zeros(allowed.shape, dtype=torch.float32).masked_fill(~allowed, torch.finfo(torch.float32).min)
+    return mask[:, None]
+
+def make_pad_collator(pad_token_id):
+    """
+    Pad a batch to its longest row (labels with -100, position_ids with 0). Packed batches
+    (those with position_ids) get a block-diagonal 4D attention mask instead of the 2D one.
+    """
+    pad_values = {"input_ids": pad_token_id, "attention_mask": 0, "labels": -100, "position_ids": 0}
+
+    def collate(features):
+        longest = max(len(f["input_ids"]) for f in features)
+        batch = {}
+        for key, pad in pad_values.items():
+            if key not in features[0]:
+                continue
+            batch[key] = torch.tensor(
+                [list(f[key]) + [pad] * (longest - len(f[key])) for f in features], dtype=torch.long
+            )
+        if "position_ids" in batch:
+            batch["attention_mask"] = packed_attention_mask(batch["position_ids"])
+        return batch
+
+    return collate
+
+def check_packed_logits(model, tokenizer, packed_row, atol=1e-4):
+    """
+    Run one packed row through the model and compare every example's logits with the same
+    example run alone; raises ValueError if attention leaks across example boundaries.
+    """
+    collate = make_pad_collator(tokenizer.pad_token_id)
+    batch = collate([packed_row])
+    pos = batch["position_ids"][0].tolist()
+    starts = [i for i, p in enumerate(pos) if p == 0] + [len(pos)]
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad():
+            device = next(model.parameters()).device
+            packed = model(input_ids=batch["input_ids"].to(device), position_ids=batch["position_ids"].to(device),
+                           attention_mask=batch["attention_mask"].to(device)).logits[0]
+            worst = 0.0
+            for a, b in zip(starts, starts[1:]):
+                alone = model(input_ids=batch["input_ids"][:, a:b].to(device)).logits[0]
+                worst = max(worst, (alone - packed[a:b]).abs().max().item())
+    finally:
+        model.train(was_training)
+    if worst > atol:
+        raise ValueError(f"packed rows leak attention across examples (max logit diff {worst:.3g})")
+    return worst
+
+def train(jsonl_path=JSONL_PATH, out_dir=OUT_DIR, seq_mode=SEQ_MODE, model_ref=MODEL_REF):
+    """
+    LoRA fine-tune `model_ref` on train.jsonl. A small model_ref (e.g. "distilgpt2") with
+    out_dir="models/draft" produces the draft model for assisted decoding in inference.py.
+    """
     print("Generating train split from:", jsonl_path)
-    ds = load_jsonl(jsonl_path)
 
-    print("Loading tokenizer and base model:", MODEL_REF)
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_REF, use_fast=True)
+    print("Loading tokenizer and base model:", model_ref)
+    tokenizer = AutoTokenizer.from_pretrained(model_ref, use_fast=True)
     # Ensure pad token exists
     if tokenizer.pad_token is None:
         tokenizer.add_special_tokens({"pad_token": "[PAD]"})
     # Set padding side to right for causal LM
     tokenizer.padding_side = "right"
 
-    base_model = AutoModelForCausalLM.from_pretrained(MODEL_REF)
+    base_model = AutoModelForCausalLM.from_pretrained(model_ref)
     # resize embeddings if tokenizer changed
     base_model.resize_token_embeddings(len(tokenizer))
 
@@ -84,23 +232,45 @@ def train(jsonl_path=JSONL_PATH, out_dir=OUT_DIR):
     peft_config = LoraConfig(
         r=8,
         lora_alpha=16,
-        target_modules=["c_attn", "c_proj"] if "gpt2" in MODEL_REF else None,
+        target_modules=["c_attn", "c_proj"] if "gpt2" in model_ref else None,
         lora_dropout=0.05,
         bias="none",
         task_type="CAUSAL_LM",
     )
     model = get_peft_model(base_model, peft_config)
 
-    print("Tokenizing dataset...")
-    tokenized = preprocess(ds, tokenizer, max_length=MAX_LENGTH)
+    print("Tokenizing dataset... (mode: %s)" % seq_mode)
+    if seq_mode == "pad":
+        tokenized = load_tokenized(jsonl_path, tokenizer, max_length=MAX_LENGTH)
+    else:
+        tokenized = load_tokenized(jsonl_path, tokenizer, max_length=MAX_LENGTH, padding=False)
+        if seq_mode == "pack":
+            n_examples = len(tokenized)
+            tokenized = pack_dataset(tokenized, max_length=MAX_LENGTH)
+            print(f"Packed {n_examples} examples into {len(tokenized)} rows")
+            diff = check_packed_logits(model, tokenizer, tokenized[0])
+            print(f"Packed attention check passed (max logit diff {diff:.2g})")
+    # labels already carry the prompt/padding mask, so only pad (never recompute) them
+    data_collator = make_pad_collator(tokenizer.pad_token_id)
 
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    # real (non-pad) tokens seen per epoch, for the throughput report
+    n_tokens = sum(sum(m) for m in tokenized["attention_mask"])
+    bucket = seq_mode == "bucket"
+    # length-grouped batches: `group_by_length` in transformers 4.x, a sampling strategy in 5.x
+    if not bucket:
+        sampler_args = {}
+    elif "group_by_length" in inspect.signature(TrainingArguments).parameters:
+        sampler_args = {"group_by_length": True}
+    else:
+        sampler_args = {"train_sampling_strategy": "group_by_length"}
 
     training_args = TrainingArguments(
         output_dir=out_dir,
         num_train_epochs=3,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=4,
+        per_device_train_batch_size=BUCKET_BATCH_SIZE if bucket else 1,
+        gradient_accumulation_steps=1 if bucket else 4,
+        **sampler_args,
+        remove_unused_columns=False,
         logging_steps=10,
         save_strategy="no",            # small dataset — avoid many checkpoint files
         learning_rate=2e-4,
@@ -115,7 +285,11 @@ def train(jsonl_path=JSONL_PATH, out_dir=OUT_DIR):
     )
 
     print("Starting training...")
-    trainer.train()
+    result = trainer.train()
+    runtime = result.metrics.get("train_runtime") or 0.0
+    if runtime:
+        total = n_tokens * training_args.num_train_epochs
+        print(f"Trained on {total} tokens in {runtime:.1f}s ({total / runtime:.1f} tokens/s)")
 
     print("Saving model to", out_dir)
     model.save_pretrained(out_dir)
@@ -1,37 +1,261 @@
 # src/indexer.py
 import json
 import os
+import threading
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
-from typing import List
+from typing import List, Optional, Tuple, Union
+
+from src import runtime, tracing
+from src.dedup import dedup_chunks, split_source_prefix
 
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # small & fast
+INDEX_PATH = "index/faiss.index"
+META_PATH = "index/meta.json"
+# named collections (one per course / PDF set) live in index/collections/<name>/
+COLLECTIONS_DIR = "index/collections"
+# process-wide LRU of loaded (faiss index, chunk list) pairs, bounded by approximate size
+INDEX_CACHE_MB = 512
+
+_EMBEDDER = {"model": None}
+_INDEX_CACHE = OrderedDict()   # index_path -> {"index", "metas", "records", "by_source", ..., "bytes", "mtime"}
+_INDEX_LOCK = threading.Lock()
+
+
+def get_embedder() -> SentenceTransformer:
+    """Load the sentence-transformer once per process."""
+    if _EMBEDDER["model"] is None:
+        _EMBEDDER["model"] = SentenceTransformer(EMBED_MODEL)
+    return _EMBEDDER["model"]
+
+
+def collection_paths(collection: Optional[str] = None) -> Tuple[str, str]:
+    """(index_path, meta_path) for a named collection; None/"default" is the global index."""
+    if not collection or collection == "default":
+        return INDEX_PATH, META_PATH
+    if os.sep in collection or collection.startswith("."):
+        raise ValueError(f"Invalid collection name: {collection!r}")
+    base = os.path.join(COLLECTIONS_DIR, collection)
+    return os.path.join(base, "faiss.index"), os.path.join(base, "meta.json")
+
+
+def list_collections() -> List[str]:
+    names = ["default"] if os.path.exists(INDEX_PATH) else []
+    if os.path.isdir(COLLECTIONS_DIR):
+        names += sorted(d for d in os.listdir(COLLECTIONS_DIR)
+                        if os.path.exists(os.path.join(COLLECTIONS_DIR, d, "faiss.index")))
+    return names
+
+
+def _evict_locked(max_bytes: int):
+    total = sum(e["bytes"] for e in _INDEX_CACHE.values())
+    while len(_INDEX_CACHE) > 1 and total > max_bytes:
+        _, old = _INDEX_CACHE.popitem(last=False)
+        total -= old["bytes"]
+        tracing.count("index_cache_evictions")
+
+
+def _prepare_entry(index, metas, meta_path, mtime):
+    """
+    Normalize meta.json (plain chunk strings or {"text", "source", "sources", "pages", "heading"}
+    records) and precompute what filtered search needs: per-source id partitions, page bounds
+    and lowercased headings.
+    """
+    texts, by_source, headings = [], {}, []
+    page_lo = np.full(len(metas), -1, dtype=np.int64)
+    page_hi = np.full(len(metas), -1, dtype=np.int64)
+    for i, m in enumerate(metas):
+        if isinstance(m, dict):
+            texts.append(m["text"])
+            srcs = m.get("sources") or ([m["source"]] if m.get("source") else [])
+            if m.get("pages"):
+                page_lo[i], page_hi[i] = m["pages"][0], m["pages"][-1]
+            headings.append((m.get("heading") or "").lower())
+        else:
+            # legacy string chunks: source only available from the "Source:" prefix
+            texts.append(m)
+            src = split_source_prefix(m)[0]
+            srcs = [src] if src else []
+            headings.append("")
+        for src in srcs:
+            by_source.setdefault(src, []).append(i)
+    by_source = {src: np.array(ids, dtype=np.int64) for src, ids in by_source.items()}
+    size = index.ntotal * index.d * 4 + sum(len(t) for t in texts)
+    return {"index": index, "metas": texts, "records": metas, "by_source": by_source, "page_lo": page_lo,
+            "page_hi": page_hi, "headings": headings, "bytes": size, "mtime": mtime, "meta_path": meta_path}
+
+
+def _load_entry(index_path: str, meta_path: str) -> dict:
+    mtime = os.path.getmtime(index_path)
+    with _INDEX_LOCK:
+        entry = _INDEX_CACHE.get(index_path)
+        if entry is not None and entry["mtime"] == mtime and entry["meta_path"] == meta_path:
+            _INDEX_CACHE.move_to_end(index_path)
+            tracing.count("index_cache_hit")
+            return entry
+    tracing.count("index_cache_miss")
+    with tracing.span("indexer.read_index"):
+        index = faiss.read_index(index_path)
+    with tracing.span("indexer.read_meta"):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            metas = json.load(f)
+    entry = _prepare_entry(index, metas, meta_path, mtime)
+    with _INDEX_LOCK:
+        _INDEX_CACHE[index_path] = entry
+        _INDEX_CACHE.move_to_end(index_path)
+        _evict_locked(INDEX_CACHE_MB * 1024 * 1024)
+    return entry
+
+
+def load_index(index_path: str, meta_path: str):
+    """
+    Return (faiss index, chunk list), reusing the process-wide LRU. Entries are reloaded when
+    the index file changes on disk and the least recently used ones are dropped once the cache
+    exceeds INDEX_CACHE_MB.
+    """
+    entry = _load_entry(index_path, meta_path)
+    return entry["index"], entry["metas"]
 
-def build_index(chunks: List[str], index_path: str = "index/faiss.index", meta_path: str = "index/meta.json"):
+
+def candidate_ids(entry: dict, source=None, pages: Optional[Tuple[int, int]] = None,
+                  heading: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Ids of chunks matching every given filter (None when no filter is set):
+      source  - file name or list of names (matches any source a chunk was deduplicated from)
+      pages   - (first, last) 1-based page range that the chunk must overlap
+      heading - case-insensitive substring of the chunk's nearest heading
+    """
+    if source is None and pages is None and heading is None:
+        return None
+    n = len(entry["metas"])
+    mask = np.ones(n, dtype=bool)
+    if source is not None:
+        names = [source] if isinstance(source, str) else list(source)
+        parts = [entry["by_source"][s] for s in names if s in entry["by_source"]]
+        mask[:] = False
+        if parts:
+            mask[np.concatenate(parts)] = True
+    if pages is not None:
+        lo, hi = pages
+        mask &= (entry["page_lo"] >= 0) & (entry["page_lo"] <= hi) & (entry["page_hi"] >= lo)
+    if heading is not None:
+        needle = heading.lower()
+        mask &= np.array([needle in h for h in entry["headings"]], dtype=bool)
+    return np.nonzero(mask)[0].astype(np.int64)
+
+
+def drop_index(index_path: str):
+    with _INDEX_LOCK:
+        _INDEX_CACHE.pop(index_path, None)
+
+def dups_path_for(meta_path: str) -> str:
+    """Sidecar file holding near-duplicate back-references for a meta.json."""
+    return os.path.splitext(meta_path)[0] + "_dups.json"
+
+
+def build_index(chunks: List[Union[str, dict]], index_path: str = INDEX_PATH, meta_path: str = META_PATH,
+                dedup: bool = True, collection: Optional[str] = None):
+    """
+    Embed chunks and write a flat L2 FAISS index plus the chunk list (meta.json).
+    Chunks are strings or records {"text", "source", "pages", "heading"} (see
+    chunker.split_pages_into_chunks); records are stored as-is so query_index can filter on them,
+    and only "text" is embedded.
+    With dedup=True, near-duplicate chunks are collapsed first (see src/dedup.py) and
+    back-references to every collapsed chunk/source are written next to meta.json.
+    If `collection` is given the index is written to that named collection instead.
+    """
+    if collection:
+        index_path, meta_path = collection_paths(collection)
     os.makedirs(os.path.dirname(index_path), exist_ok=True)
-    model = SentenceTransformer(EMBED_MODEL)
-    embeddings = model.encode(chunks, show_progress_bar=True, convert_to_numpy=True)
+    records = [c if isinstance(c, dict) else {"text": c} for c in chunks]
+    texts = [r["text"] for r in records]
+    groups = None
+    if dedup:
+        with tracing.span("indexer.dedup", chunks_in=len(texts)):
+            sources = [r.get("source") or split_source_prefix(r["text"])[0] for r in records]
+            texts, groups, stats = dedup_chunks(texts, sources=sources)
+        records = [dict(records[g["representative"]], sources=g["sources"]) if g["sources"]
+                   else records[g["representative"]] for g in groups]
+    model = get_embedder()
+    with tracing.span("indexer.encode_chunks", chunks=len(texts)), runtime.stage_threads("index"):
+        embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
     dim = embeddings.shape[1]
     index = faiss.IndexFlatL2(dim)
     index.add(np.array(embeddings, dtype="float32"))
     faiss.write_index(index, index_path)
+    # plain string list when there is no metadata (the original meta.json format)
+    structured = any(isinstance(c, dict) for c in chunks)
     with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
-    print(f"Built index with {len(chunks)} chunks; saved to {index_path}")
-
-def query_index(query: str, k: int = 5, index_path: str = "index/faiss.index", meta_path: str = "index/meta.json") -> List[str]:
-    model = SentenceTransformer(EMBED_MODEL)
-    q_emb = model.encode([query], convert_to_numpy=True).astype("float32")
-    index = faiss.read_index(index_path)
-    D, I = index.search(q_emb, k)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metas = json.load(f)
-    results = []
-    for idx in I[0]:
-        if idx < len(metas):
-            results.append(metas[idx])
-    return results
+        json.dump(records if structured else texts, f, ensure_ascii=False, indent=2)
+    if groups is not None:
+        with open(dups_path_for(meta_path), "w", encoding="utf-8") as f:
+            json.dump(groups, f, ensure_ascii=False, indent=2)
+        saved_vec_bytes = stats["removed"] * dim * 4
+        print(f"Dedup: {stats['chunks_before']} -> {stats['chunks_after']} chunks "
+              f"({stats['saved_ratio']:.1%} fewer), saved {saved_vec_bytes} index bytes and "
+              f"{stats['text_bytes_before'] - stats['text_bytes_after']} meta text bytes")
+    drop_index(index_path)
+    print(f"Built index with {len(texts)} chunks; saved to {index_path}")
+
+def encode_query(query: str) -> np.ndarray:
+    """(1, dim) float32 embedding of a query."""
+    with tracing.span("indexer.load_embedder"):
+        model = get_embedder()
+    with tracing.span("indexer.encode_query"), runtime.stage_threads("index"):
+        return model.encode([query], convert_to_numpy=True).astype("float32")
+
+
+def index_version(collection: Optional[str] = None, index_path: str = INDEX_PATH) -> Tuple[str, float]:
+    """(index_path, mtime) identifying the on-disk index a chunk id refers to."""
+    if collection:
+        index_path, _ = collection_paths(collection)
+    return index_path, os.path.getmtime(index_path)
+
+
+def search_ids(q_emb: np.ndarray, k: int = 5, index_path: str = INDEX_PATH, meta_path: str = META_PATH,
+               collection: Optional[str] = None, source=None, pages: Optional[Tuple[int, int]] = None,
+               heading: Optional[str] = None) -> List[int]:
+    """Chunk ids of the top-k hits for an encoded query (filters as in query_index)."""
+    if collection:
+        index_path, meta_path = collection_paths(collection)
+    entry = _load_entry(index_path, meta_path)
+    index, metas = entry["index"], entry["metas"]
+    ids = candidate_ids(entry, source=source, pages=pages, heading=heading)
+    with tracing.span("indexer.search", k=k, ntotal=index.ntotal,
+                      candidates=None if ids is None else len(ids)), runtime.stage_threads("index"):
+        if ids is None:
+            D, I = index.search(q_emb, k)
+        elif len(ids) == 0:
+            return []
+        else:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+            D, I = index.search(q_emb, min(k, len(ids)), params=params)
+    # faiss pads with -1 when k > ntotal
+    return [int(idx) for idx in I[0] if 0 <= idx < len(metas)]
+
+
+def chunks_for_ids(ids: List[int], index_path: str = INDEX_PATH, meta_path: str = META_PATH,
+                   collection: Optional[str] = None) -> List[str]:
+    if collection:
+        index_path, meta_path = collection_paths(collection)
+    metas = _load_entry(index_path, meta_path)["metas"]
+    return [metas[i] for i in ids if 0 <= i < len(metas)]
+
+
+def query_index(query: str, k: int = 5, index_path: str = INDEX_PATH, meta_path: str = META_PATH,
+                collection: Optional[str] = None, source=None, pages: Optional[Tuple[int, int]] = None,
+                heading: Optional[str] = None) -> List[str]:
+    """
+    Top-k chunks for `query` from the global index or a named `collection`.
+    source / pages / heading restrict the search (see candidate_ids); the candidate ids are
+    handed to FAISS as an ID selector, so all k results come from the filtered set.
+    """
+    if collection:
+        index_path, meta_path = collection_paths(collection)
+    ids = search_ids(encode_query(query), k, index_path, meta_path, source=source, pages=pages, heading=heading)
+    return chunks_for_ids(ids, index_path, meta_path)
 
 if __name__ == "__main__":
     # quick demo if you want to build from a local file "index/meta.json" chunks
@@ -2,14 +2,19 @@
 import json
 import os
 import re
-from typing import Optional
+import time
+from typing import List, Optional, Tuple, Union
 
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from peft import PeftModel
 
-from src.indexer import query_index
-from src.prompts import build_prompt
+from src import runtime, tracing
+from src.adapters import AdapterRegistry
+from src.indexer import chunks_for_ids, encode_query, index_version, search_ids
+from src.mapreduce import CHUNK_SEPARATOR, group_chunks, merge_guides
+from src.prompts import build_compact_prompt, build_prompt, fit_context
+from src.semantic_cache import SemanticCache
 
 # CONFIG
 BASE_MODEL = "gpt2"          # must match model used during fine-tuning
@@ -18,19 +23,57 @@ DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 # Keep max tokens moderate to avoid OOM or positional errors
 MAX_NEW_TOKENS = 200
+TOP_K = 5                   # retrieved chunks per topic (map-reduce uses MAP_REDUCE_TOP_K)
+BATCH_SIZE = 4              # prompts per generate() call in generate_study_guides
+# "compact" matches the fine-tuning template (src/prompts.build_compact_prompt);
+# "full" is the long schema + few-shot prompt (src/prompts.build_prompt)
+PROMPT_STYLE = "compact"
+
+# Assisted (speculative) decoding: a small draft model sharing the LoRA tokenizer proposes
+# tokens that the main model verifies. With greedy decoding the output is unchanged.
+# DRAFT_DIR is either a full model folder or a LoRA adapter folder (e.g. trained with
+# `fine_tune.train(model_ref="distilgpt2", out_dir="models/draft")`).
+ASSISTED = False
+DRAFT_DIR = "models/draft"
+NUM_ASSISTANT_TOKENS = 5
+
+# Semantic cache (src/semantic_cache.py): near-identical topics ("Short Line Model" /
+# "short transmission line model") reuse the first one's retrieved chunk ids; with
+# REUSE_CACHED_GUIDES they also get its generated guide instead of a new generate() call.
+SEMANTIC_CACHE = True
+REUSE_CACHED_GUIDES = False
+
+# Map-reduce generation (generate_study_guide_mapreduce): with a 1024-token window only a
+# slice of top_k chunks fits one prompt, so chunks are grouped to fit, a partial guide is
+# generated per group (MAP_BATCH_SIZE groups per generate() call) and the partials are merged.
+MAP_REDUCE = False
+MAP_REDUCE_TOP_K = 12
+MAP_BATCH_SIZE = BATCH_SIZE
+MAP_MAX_GROUPS = 6
 
 # cache
-_CACHED = {"tokenizer": None, "model": None, "model_max_pos": None}
+# one resident base model; LoRA adapters are hot-swapped by the registry (src/adapters.py)
+_CACHED = {"tokenizer": None, "model": None, "model_max_pos": None, "draft": None, "registry": None}
+# cumulative assisted-decoding statistics (see assist_stats())
+_ASSIST = {"generations": 0, "generated_tokens": 0, "target_forwards": 0, "draft_forwards": 0}
+_SEMANTIC = SemanticCache()
+# timings of the last map-reduce generation (see mapreduce_stats())
+_MAPREDUCE = {}
 
 
 def load_model(base_model: str = BASE_MODEL, lora_dir: str = LORA_DIR):
     """
     Load tokenizer (prefer from LORA_DIR to pick up added tokens), load base, resize embeddings
     and attach LoRA adapter. Also compute model's max position embeddings.
+    The base model is loaded once; later calls with a different lora_dir load/activate that
+    adapter on the same base (all adapters must share the first adapter's tokenizer).
     """
     global _CACHED
-    if _CACHED["tokenizer"] is not None and _CACHED["model"] is not None:
+    if _CACHED["tokenizer"] is not None and _CACHED["registry"] is not None:
+        tracing.count("model_cache_hit")
+        _CACHED["model"] = _CACHED["registry"].activate(lora_dir)
         return _CACHED["tokenizer"], _CACHED["model"], _CACHED["model_max_pos"]
+    tracing.count("model_cache_miss")
 
     # 1) tokenizer (prefer adapter folder so added tokens are present)
     try:
@@ -58,8 +101,9 @@ def load_model(base_model: str = BASE_MODEL, lora_dir: str = LORA_DIR):
     # 3) resize embeddings to tokenizer length (handles added tokens)
     base.resize_token_embeddings(len(tokenizer))
 
-    # 4) attach LoRA adapter
-    model = PeftModel.from_pretrained(base, lora_dir)
+    # 4) attach LoRA adapter (through the registry so other adapters can share `base`)
+    registry = AdapterRegistry(base)
+    model = registry.activate(lora_dir)
     model.to(DEVICE)
     model.eval()
 
@@ -71,10 +115,90 @@ def load_model(base_model: str = BASE_MODEL, lora_dir: str = LORA_DIR):
 
     _CACHED["tokenizer"] = tokenizer
     _CACHED["model"] = model
+    _CACHED["registry"] = registry
     _CACHED["model_max_pos"] = model_max_pos
     return tokenizer, model, model_max_pos
 
 
+def load_draft_model(tokenizer, draft_dir: str = DRAFT_DIR):
+    """
+    Load the draft model used for assisted decoding. It must share the main tokenizer
+    (including added tokens such as [PAD]), so its vocabulary is resized to len(tokenizer)
+    and a mismatching adapter/model raises ValueError.
+    """
+    if _CACHED["draft"] is not None:
+        return _CACHED["draft"]
+    adapter_cfg = os.path.join(draft_dir, "adapter_config.json")
+    if os.path.exists(adapter_cfg):
+        with open(adapter_cfg, "r", encoding="utf-8") as f:
+            draft_base = json.load(f)["base_model_name_or_path"]
+        base = AutoModelForCausalLM.from_pretrained(draft_base)
+        base.resize_token_embeddings(len(tokenizer))
+        draft = PeftModel.from_pretrained(base, draft_dir)
+    else:
+        draft = AutoModelForCausalLM.from_pretrained(draft_dir)
+        draft.resize_token_embeddings(len(tokenizer))
+    if draft.get_input_embeddings().weight.shape[0] != len(tokenizer):
+        raise ValueError(f"Draft model in {draft_dir} does not match the tokenizer vocabulary ({len(tokenizer)})")
+    draft.to(DEVICE)
+    draft.eval()
+    draft.generation_config.num_assistant_tokens = NUM_ASSISTANT_TOKENS
+    _CACHED["draft"] = draft
+    return draft
+
+
+def _count_forwards(module, counts: dict, key: str):
+    """Forward hook counting calls of `module` into counts[key]; returns the hook handle."""
+    def hook(mod, args, output):
+        counts[key] += 1
+    # PeftModel.generate runs the wrapped transformers model, so hook that one
+    core = module.get_base_model() if hasattr(module, "get_base_model") else module
+    return core.register_forward_hook(hook)
+
+
+def assist_stats() -> dict:
+    """
+    Cumulative assisted-decoding statistics. Every target (main model) forward emits one token
+    of its own plus the draft tokens it accepted, and every draft forward proposes one token, so
+        acceptance_rate = (generated_tokens - target_forwards) / draft_forwards
+    """
+    st = dict(_ASSIST)
+    accepted = max(0, st["generated_tokens"] - st["target_forwards"])
+    st["acceptance_rate"] = accepted / st["draft_forwards"] if st["draft_forwards"] else 0.0
+    st["tokens_per_target_forward"] = st["generated_tokens"] / st["target_forwards"] if st["target_forwards"] else 0.0
+    return st
+
+
+def compare_assisted_greedy(prompt: str, max_new_tokens: int = MAX_NEW_TOKENS) -> dict:
+    """
+    Run plain greedy and draft-assisted decoding on the same prompt and check that they
+    produce identical token ids (they must: the main model verifies every draft token).
+    """
+    tokenizer, model, model_max_pos = load_model(base_model=BASE_MODEL, lora_dir=LORA_DIR)
+    draft = load_draft_model(tokenizer, draft_dir=DRAFT_DIR)
+    tok = safe_tokenize_truncate(tokenizer, prompt, model_max_pos, max_new_tokens)
+    kwargs = dict(
+        input_ids=tok["input_ids"].to(DEVICE),
+        attention_mask=tok["attention_mask"].to(DEVICE),
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    with torch.no_grad():
+        t0 = time.perf_counter()
+        greedy = model.generate(**kwargs)
+        t1 = time.perf_counter()
+        assisted = model.generate(assistant_model=draft, **kwargs)
+        t2 = time.perf_counter()
+    return {
+        "match": torch.equal(greedy, assisted),
+        "greedy_s": t1 - t0,
+        "assisted_s": t2 - t1,
+        "speedup": (t1 - t0) / (t2 - t1) if t2 > t1 else 0.0,
+    }
+
+
 def extract_json_from_text(text: str) -> dict:
     """Try to extract first JSON object; fallback to raw_output."""
     # Balanced braces search
@@ -116,59 +240,307 @@ def safe_tokenize_truncate(tokenizer, text: str, model_max_pos: int, max_new_tok
     return tok
 
 
-def generate_study_guide(topic: str, top_k: int = 5, save: bool = True, model_override: Optional[str] = None):
+class _TokenTimer:
+    """
+    Minimal generate() streamer used only while tracing: the first put() carries the prompt,
+    the second the first generated token, so the gap between them is prefill time.
+    """
+
+    def __init__(self):
+        self.t_start = time.perf_counter()
+        self.t_first = None
+        self.t_end = None
+        self._seen_prompt = False
+
+    def put(self, value):
+        if self.t_first is None and self._seen_prompt:
+            self.t_first = time.perf_counter()
+        self._seen_prompt = True
+
+    def end(self):
+        self.t_end = time.perf_counter()
+
+    def timings(self):
+        first = self.t_first or self.t_end or self.t_start
+        end = self.t_end or first
+        return {"prefill_ms": (first - self.t_start) * 1000, "decode_ms": (end - first) * 1000}
+
+
+def _save_output(topic: str, parsed: dict):
+    os.makedirs("outputs", exist_ok=True)
+    outpath = os.path.join("outputs", f"{topic.replace(' ', '_')}.json")
+    with open(outpath, "w", encoding="utf-8") as f:
+        json.dump(parsed, f, ensure_ascii=False, indent=2)
+
+
+def retrieve(topic: str, top_k: int = 5, collection: Optional[str] = None, filters: Optional[dict] = None,
+             guide_variant: Optional[str] = None):
+    """
+    Chunks for `topic`, going through the semantic cache when SEMANTIC_CACHE is on.
+    Returns (chunks, cache_key, cached_guide); cached_guide is only looked up when
+    `guide_variant` is given (the adapter the guide must come from) and cache_key is None
+    when the cache is off.
+    """
+    q_emb = encode_query(topic)
+    if not SEMANTIC_CACHE:
+        return chunks_for_ids(search_ids(q_emb, top_k, collection=collection, **(filters or {})),
+                              collection=collection), None, None
+    scope = (index_version(collection), top_k, json.dumps(filters or {}, sort_keys=True, default=str))
+    hit = _SEMANTIC.lookup(q_emb, scope, guide_variant=guide_variant)
+    if hit is not None:
+        return chunks_for_ids(hit["ids"], collection=collection), hit["key"], hit["guide"]
+    ids = search_ids(q_emb, top_k, collection=collection, **(filters or {}))
+    return chunks_for_ids(ids, collection=collection), _SEMANTIC.add(q_emb, topic, scope, ids), None
+
+
+def semantic_cache_metrics() -> dict:
+    """Hit rate, guide hits, evictions and size of the semantic query cache."""
+    return _SEMANTIC.metrics()
+
+
+def _build_prompt(topic: str, context: str, tokenizer=None, model_max_pos: Optional[int] = None) -> str:
+    """
+    Prompt for `topic`. Given the tokenizer and position limit, the context is trimmed first
+    so the whole prompt plus MAX_NEW_TOKENS fits and safe_tokenize_truncate never has to cut
+    off the instruction tail / response marker.
+    """
+    build = build_compact_prompt if PROMPT_STYLE == "compact" else build_prompt
+    if tokenizer is not None and model_max_pos:
+        overhead = len(tokenizer(build(topic, ""))["input_ids"])
+        # a few tokens of slack: BPE merges can shift by a token where the cut text is re-joined
+        context = fit_context(tokenizer, context, model_max_pos - MAX_NEW_TOKENS - overhead - 4)
+    return build(topic, context)
+
+
+def generate_study_guide(topic: str, top_k: Optional[int] = None, save: bool = True, model_override: Optional[str] = None,
+                         assisted: Optional[bool] = None, lora_dir: Optional[str] = None,
+                         collection: Optional[str] = None, filters: Optional[dict] = None,
+                         map_reduce: Optional[bool] = None):
     """
     RAG + LoRA generation pipeline:
      - retrieve relevant chunks
      - build prompt
      - load model & tokenizer (with added tokens handling)
      - safely tokenize + truncate prompt
-     - generate with a safe max_new_tokens
+     - generate with a safe max_new_tokens (optionally assisted by the draft model)
      - extract JSON and save
+    lora_dir selects a per-course adapter (default LORA_DIR) on the shared base model and
+    collection a named index collection (default: index/faiss.index); filters restricts
+    retrieval by metadata, e.g. {"source": "calc2.pdf", "pages": (10, 20), "heading": "series"}.
+    map_reduce (default MAP_REDUCE) hands off to generate_study_guide_mapreduce; top_k then
+    defaults to MAP_REDUCE_TOP_K instead of TOP_K unless given explicitly.
     """
-    # 1) retrieve
-    chunks = query_index(topic, k=top_k)
-    context = "\n\n----\n\n".join(chunks)
-
-    # 2) prompt
-    prompt = build_prompt(topic, context)
-
-    # 3) load model/tokenizer & model position limit
-    tokenizer, model, model_max_pos = load_model(base_model=(model_override or BASE_MODEL), lora_dir=LORA_DIR)
-
-    # 4) tokenize safely (truncate to allowed length)
-    tokenized = safe_tokenize_truncate(tokenizer, prompt, model_max_pos, MAX_NEW_TOKENS)
-    input_ids = tokenized["input_ids"].to(DEVICE)
-    attention_mask = tokenized.get("attention_mask", None)
-    if attention_mask is not None:
-        attention_mask = attention_mask.to(DEVICE)
-
-    # 5) generate (avoid unsupported or ignored args)
-    # Make generation deterministic (no sampling)
-    gen_kwargs = dict(
-        input_ids=input_ids,
-        attention_mask=attention_mask,
-        max_new_tokens=MAX_NEW_TOKENS,
-        do_sample=False,
-        eos_token_id=tokenizer.eos_token_id,
-        pad_token_id=tokenizer.pad_token_id,
-    )
+    if MAP_REDUCE if map_reduce is None else map_reduce:
+        return generate_study_guide_mapreduce(topic, top_k=top_k or MAP_REDUCE_TOP_K, save=save, model_override=model_override,
+                                              lora_dir=lora_dir, collection=collection, filters=filters)
+    top_k = top_k or TOP_K
+    assisted = ASSISTED if assisted is None else assisted
+    lora_dir = lora_dir or LORA_DIR
+    with tracing.span("generate_study_guide", topic=topic, top_k=top_k) as root, runtime.stage_threads("inference"):
+        # 1) retrieve (semantic cache first)
+        with tracing.span("inference.retrieve"):
+            chunks, cache_key, cached = retrieve(topic, top_k, collection, filters,
+                                                 guide_variant=lora_dir if REUSE_CACHED_GUIDES else None)
+        if cached is not None:
+            root.set(cached_guide=True)
+            parsed = dict(cached)
+            if save:
+                _save_output(topic, parsed)
+            return parsed
+        context = "\n\n----\n\n".join(chunks)
 
-    with torch.no_grad():
-        outputs = model.generate(**gen_kwargs)
+        # 2) load model/tokenizer & model position limit
+        with tracing.span("inference.load_model"):
+            tokenizer, model, model_max_pos = load_model(base_model=(model_override or BASE_MODEL), lora_dir=lora_dir)
 
-    text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # 3) prompt, with the context trimmed to the token budget
+        prompt = _build_prompt(topic, context, tokenizer, model_max_pos)
 
-    # 6) parse JSON and save
-    parsed = extract_json_from_text(text)
-    os.makedirs("outputs", exist_ok=True)
-    outpath = os.path.join("outputs", f"{topic.replace(' ', '_')}.json")
-    with open(outpath, "w", encoding="utf-8") as f:
-        json.dump(parsed, f, ensure_ascii=False, indent=2)
+        # 4) tokenize safely (truncate to allowed length)
+        with tracing.span("inference.tokenize"):
+            tokenized = safe_tokenize_truncate(tokenizer, prompt, model_max_pos, MAX_NEW_TOKENS)
+            input_ids = tokenized["input_ids"].to(DEVICE)
+            attention_mask = tokenized.get("attention_mask", None)
+            if attention_mask is not None:
+                attention_mask = attention_mask.to(DEVICE)
+        if tracing.enabled():
+            # extra untruncated tokenization only paid while tracing
+            full_len = len(tokenizer(_build_prompt(topic, context))["input_ids"])
+            tracing.count("prompt_tokens", input_ids.shape[1])
+            tracing.count("truncated_tokens", max(0, full_len - input_ids.shape[1]))
+
+        # 5) generate (avoid unsupported or ignored args)
+        # Make generation deterministic (no sampling)
+        gen_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+        )
+        timer = _TokenTimer() if tracing.enabled() else None
+        if timer is not None:
+            gen_kwargs["streamer"] = timer
+        hooks, counts = [], {"target_forwards": 0, "draft_forwards": 0}
+        if assisted:
+            with tracing.span("inference.load_draft"):
+                draft = load_draft_model(tokenizer, draft_dir=DRAFT_DIR)
+            gen_kwargs["assistant_model"] = draft
+            hooks.append(_count_forwards(model, counts, "target_forwards"))
+            hooks.append(_count_forwards(draft, counts, "draft_forwards"))
+
+        with tracing.span("inference.generate", assisted=assisted) as gen_span:
+            try:
+                # hold the adapter while generating so another caller can't switch it mid-way
+                with _CACHED["registry"].use(lora_dir), torch.no_grad():
+                    outputs = model.generate(**gen_kwargs)
+            finally:
+                for h in hooks:
+                    h.remove()
+            n_generated = outputs.shape[1] - input_ids.shape[1]
+            if assisted:
+                _ASSIST["generations"] += 1
+                _ASSIST["generated_tokens"] += n_generated
+                _ASSIST["target_forwards"] += counts["target_forwards"]
+                _ASSIST["draft_forwards"] += counts["draft_forwards"]
+                gen_span.set(**counts)
+            if timer is not None:
+                gen_span.set(**timer.timings())
+                tracing.count("generated_tokens", n_generated)
+
+        # decode only the continuation (the prompt itself may contain example JSON)
+        with tracing.span("inference.decode_text"):
+            text = tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True)
 
+        # 6) parse JSON and save
+        with tracing.span("inference.extract_json"):
+            parsed = extract_json_from_text(text)
+        root.set(valid_json="raw_output" not in parsed)
+        if cache_key is not None and "raw_output" not in parsed:
+            _SEMANTIC.set_guide(cache_key, parsed, variant=lora_dir)
+        if save:
+            _save_output(topic, parsed)
+
+    return parsed
+
+
+def generate_study_guide_mapreduce(topic: str, top_k: int = MAP_REDUCE_TOP_K, save: bool = True,
+                                   model_override: Optional[str] = None, lora_dir: Optional[str] = None, collection: Optional[str] = None,
+                                   filters: Optional[dict] = None, batch_size: int = MAP_BATCH_SIZE,
+                                   max_groups: int = MAP_MAX_GROUPS):
+    """
+    Map-reduce generation for topics whose retrieved context exceeds the model window:
+     - map: pack the top_k chunks into groups that each fit the window (src/mapreduce.group_chunks)
+       and generate a partial guide per group, `batch_size` prompts per generate() call
+     - reduce: merge the partials into one schema-complete guide (src/mapreduce.merge_guides)
+    Work per topic is bounded by max_groups generations; phase timings of the last call are
+    returned by mapreduce_stats().
+    """
+    lora_dir = lora_dir or LORA_DIR
+    timings = {}
+    with tracing.span("generate_study_guide_mapreduce", topic=topic, top_k=top_k) as root, \
+            runtime.stage_threads("inference"):
+        t0 = time.perf_counter()
+        with tracing.span("mapreduce.retrieve"):
+            chunks, _, _ = retrieve(topic, top_k, collection, filters)
+        t_load = time.perf_counter()
+        tokenizer, model, model_max_pos = load_model(base_model=(model_override or BASE_MODEL), lora_dir=lora_dir)
+        t1 = time.perf_counter()
+
+        with tracing.span("mapreduce.map") as map_span:
+            overhead = len(tokenizer(_build_prompt(topic, ""))["input_ids"])
+            budget = max(1, model_max_pos - MAX_NEW_TOKENS - overhead)
+            groups = group_chunks(chunks, tokenizer, budget, max_groups)
+            prompts = [_build_prompt(topic, CHUNK_SEPARATOR.join(g), tokenizer, model_max_pos) for g in groups]
+            texts = []
+            for b in range(0, len(prompts), batch_size):
+                texts += _generate_batch(tokenizer, model, model_max_pos, prompts[b:b + batch_size], lora_dir)
+            partials = [extract_json_from_text(t) for t in texts]
+            n_valid = sum("raw_output" not in p for p in partials)
+            map_span.set(groups=len(groups), valid_partials=n_valid)
+        t2 = time.perf_counter()
+
+        with tracing.span("mapreduce.reduce"):
+            if n_valid:
+                parsed = merge_guides(topic, partials)
+            else:
+                # nothing parseable to merge: keep the raw outputs like generate_study_guide does
+                parsed = {"raw_output": "\n\n".join(texts)}
+        t3 = time.perf_counter()
+        root.set(valid_json="raw_output" not in parsed)
+        if save:
+            _save_output(topic, parsed)
+
+    timings.update(retrieve_ms=(t_load - t0) * 1000, load_ms=(t1 - t_load) * 1000, map_ms=(t2 - t1) * 1000, reduce_ms=(t3 - t2) * 1000,
+                   chunks=len(chunks), groups=len(groups), batches=-(-len(groups) // batch_size),
+                   valid_partials=n_valid)
+    _MAPREDUCE.clear()
+    _MAPREDUCE.update(timings)
     return parsed
 
 
+def mapreduce_stats() -> dict:
+    """Phase timings and group counts of the last generate_study_guide_mapreduce call."""
+    return dict(_MAPREDUCE)
+
+
+def _generate_batch(tokenizer, model, model_max_pos: int, prompts: List[str], lora_dir: str) -> List[str]:
+    """Greedy-generate continuations for several prompts in one left-padded generate() call."""
+    # decoder-only batching needs left padding so every row ends at the prompt
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        tok = safe_tokenize_truncate(tokenizer, prompts, model_max_pos, MAX_NEW_TOKENS)
+    finally:
+        tokenizer.padding_side = padding_side
+    with _CACHED["registry"].use(lora_dir), torch.no_grad():
+        outputs = model.generate(
+            input_ids=tok["input_ids"].to(DEVICE),
+            attention_mask=tok["attention_mask"].to(DEVICE),
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+        )
+    prompt_len = tok["input_ids"].shape[1]
+    return [tokenizer.decode(outputs[row][prompt_len:], skip_special_tokens=True) for row in range(len(prompts))]
+
+
+def generate_study_guides(requests: List[Union[str, Tuple[str, str]]], top_k: int = 5, save: bool = True,
+                          batch_size: int = BATCH_SIZE, collection: Optional[str] = None,
+                          filters: Optional[dict] = None) -> List[dict]:
+    """
+    Batched generation for many topics. `requests` holds topics or (topic, lora_dir) pairs;
+    requests sharing an adapter are generated together in left-padded batches of `batch_size`,
+    switching adapters only between groups. Results are returned in request order.
+    """
+    reqs = [(r, LORA_DIR) if isinstance(r, str) else (r[0], r[1] or LORA_DIR) for r in requests]
+    groups = {}
+    for i, (_, lora_dir) in enumerate(reqs):
+        groups.setdefault(lora_dir, []).append(i)
+
+    results = [None] * len(reqs)
+    for lora_dir, idxs in groups.items():
+        tokenizer, model, model_max_pos = load_model(base_model=BASE_MODEL, lora_dir=lora_dir)
+        for b in range(0, len(idxs), batch_size):
+            batch = idxs[b:b + batch_size]
+            with tracing.span("generate_study_guides.batch", adapter=lora_dir, size=len(batch)), \
+                    runtime.stage_threads("inference"):
+                keys, prompts = {}, []
+                for i in batch:
+                    chunks, keys[i], _ = retrieve(reqs[i][0], top_k, collection, filters)
+                    prompts.append(_build_prompt(reqs[i][0], "\n\n----\n\n".join(chunks), tokenizer, model_max_pos))
+                texts = _generate_batch(tokenizer, model, model_max_pos, prompts, lora_dir)
+                for i, text in zip(batch, texts):
+                    results[i] = extract_json_from_text(text)
+                    if keys[i] is not None and "raw_output" not in results[i]:
+                        _SEMANTIC.set_guide(keys[i], results[i], variant=lora_dir)
+                    if save:
+                        _save_output(reqs[i][0], results[i])
+    return results
+
+
 if __name__ == "__main__":
     test_topic = "Short Line Model"
     print(f"Generating study guide for: {test_topic}")
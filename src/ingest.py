@@ -3,11 +3,23 @@ import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
 import io, os, re
-from typing import Dict
+from typing import Dict, List
+
+from src import runtime, tracing
 
 OCR_DPI = 200
 MIN_TEXT_LEN = 50         # if page text length < MIN_TEXT_LEN -> use OCR
 
+# Adaptive OCR ("adaptive"): only OCR image regions (or the full page when it only has vector
+# drawings), start at a low DPI and re-OCR at higher DPIs while tesseract's mean word
+# confidence stays low.
+# "fixed" keeps the original behaviour (whole page at OCR_DPI).
+OCR_MODE = "adaptive"
+OCR_DPI_STEPS = (150, 300, 400)
+OCR_MIN_CONF = 70         # mean word confidence (0-100) considered good enough
+OCR_MIN_WORDS = 5         # still fewer words than this after one escalation -> treat as a figure, stop
+OCR_MIN_IMAGE_AREA = 0.01 # ignore images covering less than this fraction of the page (logos, bullets)
+
 def _clean_extracted_text(text: str) -> str:
     """
     Light cleaning:
@@ -46,42 +58,130 @@ def _clean_extracted_text(text: str) -> str:
     txt = re.sub(r"[ \t]{2,}", " ", txt)
     return txt.strip()
 
-def pdf_page_to_image(page, dpi=OCR_DPI):
-    """Return a PIL image from a PyMuPDF page for OCR."""
-    pix = page.get_pixmap(dpi=dpi)
+def pdf_page_to_image(page, dpi=OCR_DPI, clip=None):
+    """Return a PIL image from a PyMuPDF page (optionally only the `clip` rect) for OCR."""
+    pix = page.get_pixmap(dpi=dpi, clip=clip)
     mode = "RGBA" if pix.alpha else "RGB"
     img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
     if img.mode != "RGB":
         img = img.convert("RGB")
     return img
 
+def ocr_regions(page):
+    """
+    Cheap structural probe: bounding boxes of the images worth OCRing on `page`.
+    Empty list -> nothing rasterized on the page (blank, or text drawn as vector paths).
+    """
+    page_area = abs(page.rect) or 1.0
+    rects = []
+    for info in page.get_image_info():
+        r = fitz.Rect(info["bbox"]) & page.rect
+        if not r.is_empty and abs(r) / page_area >= OCR_MIN_IMAGE_AREA:
+            rects.append(r)
+    return rects
+
+def ocr_with_confidence(img):
+    """OCR a PIL image; returns (text, mean word confidence 0-100, word count)."""
+    data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+    lines, confs = {}, []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confs.append(conf)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    mean_conf = sum(confs) / len(confs) if confs else 0.0
+    return text, mean_conf, len(confs)
+
+def adaptive_ocr_page(page) -> str:
+    """
+    OCR only the image regions of a page: low DPI first, escalating through OCR_DPI_STEPS
+    while confidence is below OCR_MIN_CONF. Text-layer blocks outside the OCR'd area are kept
+    (see _merge_text_layer). Pages without images but with vector drawings
+    (text drawn as paths) get the same treatment on the full page; only pages with neither
+    are skipped.
+    """
+    rects = ocr_regions(page)
+    if rects:
+        # crop to the union of image regions (a full-page scan gives the whole page)
+        clip = fitz.Rect(rects[0])
+        for r in rects[1:]:
+            clip |= r
+    elif page.get_drawings():
+        tracing.count("ocr_vector_pages")
+        clip = page.rect
+    else:
+        tracing.count("ocr_skipped_pages")
+        return ""
+    best_text, best_conf = "", -1.0
+    for step, dpi in enumerate(OCR_DPI_STEPS):
+        with tracing.span("ingest.ocr_pass", dpi=dpi) as sp:
+            text, conf, n_words = ocr_with_confidence(pdf_page_to_image(page, dpi=dpi, clip=clip))
+            sp.set(conf=conf, words=n_words)
+        if step:
+            tracing.count("ocr_escalations")
+        if conf > best_conf:
+            best_text, best_conf = text, conf
+        # good enough: stop. Low confidence always gets at least one higher DPI (small print
+        # often yields few or no words at the lowest DPI); if that still finds almost no
+        # words the region is a figure and higher DPIs won't help either.
+        if conf >= OCR_MIN_CONF or (step >= 1 and n_words < OCR_MIN_WORDS):
+            break
+    return _merge_text_layer(page, clip, best_text)
+
+def _merge_text_layer(page, clip, ocr_text: str) -> str:
+    """
+    Put the OCR of `clip` back in reading order with the page's text-layer blocks that lie
+    outside it (captions, headings next to a figure), so region OCR never drops them.
+    """
+    parts = [(clip.y0, clip.x0, ocr_text)] if ocr_text.strip() else []
+    for x0, y0, x1, y1, text, *_ in page.get_text("blocks"):
+        if text.strip() and not fitz.Rect(x0, y0, x1, y1).intersects(clip):
+            parts.append((y0, x0, text.strip()))
+    return "\n".join(t for _, _, t in sorted(parts, key=lambda p: (p[0], p[1])))
+
+def pdf_to_pages(path: str, ocr_enabled: bool = True) -> List[str]:
+    """
+    Raw (uncleaned) text of every page, falling back to OCR for pages with little text.
+    """
+    with tracing.span("ingest.pdf_to_pages", path=os.path.basename(path)) as sp, runtime.stage_threads("ingest"):
+        doc = fitz.open(path)
+        texts = []
+        for i, page in enumerate(doc):
+            try:
+                text = page.get_text("text")
+            except Exception:
+                text = ""
+            # If extracted text is short and OCR enabled, do OCR
+            if ocr_enabled and (not text or len(text.strip()) < MIN_TEXT_LEN):
+                tracing.count("ocr_pages")
+                try:
+                    with tracing.span("ingest.ocr_page", page=i):
+                        if OCR_MODE == "adaptive":
+                            ocr_text = adaptive_ocr_page(page)
+                        else:
+                            img = pdf_page_to_image(page)
+                            # pytesseract returns '\n' terminated lines; specify lang if needed
+                            ocr_text = pytesseract.image_to_string(img)
+                    # prefer OCR when it's longer than the extracted text
+                    if len(ocr_text.strip()) > len(text.strip()):
+                        text = ocr_text
+                except Exception:
+                    # fallback: keep whatever text we have
+                    pass
+            texts.append(text)
+        sp.set(pages=len(texts))
+    return texts
+
 def pdf_to_text(path: str, ocr_enabled: bool = True, debug_write: bool = False) -> str:
     """
     Extract text from PDF using PyMuPDF, falling back to OCR for pages with little text.
     Returns the cleaned full-text string.
     If debug_write=True, writes <filename>.txt in data/raw_notes/debug/ for inspection.
     """
-    doc = fitz.open(path)
-    texts = []
-    for i, page in enumerate(doc):
-        try:
-            text = page.get_text("text")
-        except Exception:
-            text = ""
-        # If extracted text is short and OCR enabled, do OCR
-        if ocr_enabled and (not text or len(text.strip()) < MIN_TEXT_LEN):
-            try:
-                img = pdf_page_to_image(page)
-                # pytesseract returns '\n' terminated lines; specify lang if needed
-                ocr_text = pytesseract.image_to_string(img)
-                # prefer OCR when it's longer than the extracted text
-                if len(ocr_text.strip()) > len(text.strip()):
-                    text = ocr_text
-            except Exception:
-                # fallback: keep whatever text we have
-                pass
-        texts.append(text)
-
+    texts = pdf_to_pages(path, ocr_enabled=ocr_enabled)
     full = "\n\n".join(texts)
     cleaned = _clean_extracted_text(full)
     if debug_write:
@@ -108,6 +208,21 @@ def load_all_notes(folder: str = "data/raw_notes", debug_write: bool = False) ->
     return docs
 
 
+def load_all_note_pages(folder: str = "data/raw_notes") -> Dict[str, List[str]]:
+    """
+    Like load_all_notes, but keeps page boundaries: {filename: [cleaned text per page]}.
+    """
+    docs = {}
+    for fn in sorted(os.listdir(folder)):
+        if fn.lower().endswith(".pdf"):
+            path = os.path.join(folder, fn)
+            try:
+                docs[fn] = [_clean_extracted_text(t) for t in pdf_to_pages(path, ocr_enabled=True)]
+            except Exception:
+                docs[fn] = []
+    return docs
+
+
 if __name__ == "__main__":
     docs = load_all_notes(debug_write=True)
     for k, v in docs.items():
@@ -1,14 +1,15 @@
 # one-off script: src/make_index.py
-from src.ingest import load_all_notes
-from src.chunker import split_into_chunks
+from src.ingest import load_all_note_pages
+from src.chunker import split_pages_into_chunks
 from src.indexer import build_index
 
-docs = load_all_notes("data/raw_notes")
+docs = load_all_note_pages("data/raw_notes")
 all_chunks = []
-for fname, text in docs.items():
-    chs = split_into_chunks(text)
-    # optionally prefix chunk with filename/topic
-    chs = [f"Source: {fname}\n\n{c}" for c in chs]
-    all_chunks.extend(chs)
+for fname, pages in docs.items():
+    # structured metadata (source, pages, heading) instead of a "Source:" prefix in the text,
+    # so embeddings aren't polluted by file names and query_index can filter by source
+    for rec in split_pages_into_chunks(pages):
+        rec["source"] = fname
+        all_chunks.append(rec)
 
 build_index(all_chunks)
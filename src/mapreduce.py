@@ -0,0 +1,95 @@
+# src/mapreduce.py
+import re
+from typing import List
+
+# CONFIG
+MAX_KEY_POINTS = 10
+MAX_QUESTIONS = 8
+MAX_EXAMPLES = 4
+MAX_SUMMARY_SENTENCES = 6
+NEAR_DUP_JACCARD = 0.7     # word-set overlap above which two list items are the same point
+CHUNK_SEPARATOR = "\n\n----\n\n"
+
+
+def group_chunks(chunks: List[str], tokenizer, budget: int, max_groups: int) -> List[List[str]]:
+    """
+    Pack retrieved chunks (in rank order) into groups whose joined token count fits `budget`,
+    so every map prompt is seen whole by the model. A chunk longer than the budget is cut to
+    it rather than being truncated away together with the response marker. At most
+    `max_groups` groups are returned (the lowest-ranked chunks are dropped first).
+    """
+    sep_len = len(tokenizer(CHUNK_SEPARATOR)["input_ids"])
+    ids = tokenizer(list(chunks))["input_ids"] if chunks else []
+    groups, cur, used = [], [], 0
+    for text, toks in zip(chunks, ids):
+        if len(toks) > budget:
+            text, toks = tokenizer.decode(toks[:budget]), toks[:budget]
+        cost = len(toks) + (sep_len if cur else 0)
+        if cur and used + cost > budget:
+            groups.append(cur)
+            cur, used, cost = [], 0, len(toks)
+        cur.append(text)
+        used += cost
+    if cur:
+        groups.append(cur)
+    return groups[:max_groups]
+
+
+def _words(s: str) -> set:
+    return set(re.findall(r"\w+", (s or "").lower()))
+
+
+def _dedup(items, key, limit):
+    """Keep items in order, dropping ones whose key text nearly repeats an earlier one."""
+    kept, seen = [], []
+    for it in items:
+        w = _words(key(it))
+        if not w:
+            continue
+        if any(len(w & s) / len(w | s) >= NEAR_DUP_JACCARD for s in seen):
+            continue
+        seen.append(w)
+        kept.append(it)
+        if len(kept) >= limit:
+            break
+    return kept
+
+
+def _dicts(items, fields):
+    """Schema-shaped dicts from a partial's list (drops non-dict entries, fills missing fields)."""
+    out = []
+    for it in items if isinstance(items, list) else []:
+        if isinstance(it, dict):
+            out.append({f: it.get(f, [] if f == "solution_steps" else "") for f in fields})
+    return out
+
+
+def merge_guides(topic: str, partials: List[dict]) -> dict:
+    """
+    Reduce per-group partial guides into one guide with every schema key: summary sentences,
+    key points, questions and examples are concatenated in rank order with near-duplicates
+    removed; formulas are deduplicated on whitespace-free LaTeX.
+    """
+    valid = [p for p in partials if isinstance(p, dict) and "raw_output" not in p]
+    sentences = []
+    for p in valid:
+        sentences += [s.strip() for s in re.split(r"(?<=[.!?])\s+", str(p.get("summary") or "")) if s.strip()]
+    key_points = [str(k).strip() for p in valid for k in (p.get("key_points") or []) if isinstance(k, (str, int, float))]
+
+    formulas, seen_latex = [], set()
+    for f in (f for p in valid for f in _dicts(p.get("formulas"), ("latex", "name", "meaning", "units"))):
+        key = re.sub(r"\s+", "", str(f["latex"]))
+        if key and key not in seen_latex:
+            seen_latex.add(key)
+            formulas.append(f)
+
+    questions = [q for p in valid for q in _dicts(p.get("important_questions"), ("q", "why_important", "difficulty"))]
+    examples = [e for p in valid for e in _dicts(p.get("solved_examples"), ("question", "solution_steps", "final_answer"))]
+    return {
+        "topic": topic,
+        "summary": " ".join(_dedup(sentences, str, MAX_SUMMARY_SENTENCES)),
+        "key_points": _dedup(key_points, str, MAX_KEY_POINTS),
+        "formulas": formulas,
+        "important_questions": _dedup(questions, lambda q: str(q["q"]), MAX_QUESTIONS),
+        "solved_examples": _dedup(examples, lambda e: str(e["question"]), MAX_EXAMPLES),
+    }
@@ -0,0 +1,201 @@
+# src/multiworker.py
+"""
+Multi-process generation that shares one copy of the model weights.
+
+The parent loads the tokenizer, base model + LoRA adapter, embedder and FAISS index once
+(src/inference.load_model), freezes the GC so collections don't dirty the heap, then forks
+workers. Forked workers see the parent's tensors as copy-on-write pages: weights are only
+ever read during generate(), so they stay physically shared and each worker's *private*
+memory is just activations, KV cache and its Python heap. Topics are handed out through a
+work queue so fast workers pick up more of them.
+
+    python -m src.multiworker --workers 4 "Short Line Model" "Surge Impedance Loading"
+    python -m src.multiworker --workers 4 --compare "Short Line Model" ...   # vs naive per-worker loads
+
+Linux/CPU only (fork after CUDA init is not supported; macOS forks are unsafe with torch).
+"""
+import gc
+import multiprocessing as mp
+import os
+import queue
+import resource
+import sys
+import time
+from typing import List, Optional
+
+from src import inference, runtime, tracing
+from src.indexer import collection_paths, get_embedder, load_index
+
+# CONFIG
+WORKERS = 4
+RESULT_TIMEOUT_S = 600     # give up on a worker that produces nothing for this long
+
+
+def memory_mb() -> dict:
+    """
+    This process's memory from /proc/self/smaps_rollup: rss, pss (shared pages split between
+    the processes mapping them), shared and private. Falls back to peak RSS elsewhere.
+    """
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb",
+              "Private_Clean": "private_mb", "Private_Dirty": "private_mb"}
+    out = dict.fromkeys(fields.values(), 0.0)
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    out[fields[key]] += int(rest.split()[0]) / 1024
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out["rss_mb"] = out["pss_mb"] = out["private_mb"] = rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return out
+
+
+def _worker(wid: int, tasks, results, release, opts: dict):
+    """Worker loop: generate guides for queued (index, topic) pairs until the None sentinel."""
+    # split the inference thread budget between workers instead of each taking all cores
+    runtime.set_budget("inference", opts["threads"])
+    runtime.set_budget("index", opts["threads"])
+    done = 0
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        i, topic = item
+        try:
+            guide = inference.generate_study_guide(topic, top_k=opts["top_k"], save=opts["save"],
+                                                   model_override=opts["base_model"], lora_dir=opts["lora_dir"],
+                                                   collection=opts["collection"])
+            results.put(("result", wid, i, guide, None))
+        except Exception as e:
+            results.put(("result", wid, i, None, f"{type(e).__name__}: {e}"))
+        done += 1
+    results.put(("memory", wid, done, memory_mb(), os.getpid()))
+    # stay alive until the parent has measured itself, so shared pages are still split
+    release.wait(RESULT_TIMEOUT_S)
+
+
+def _preload(opts: dict):
+    """Load everything generate_study_guide touches so forked workers inherit it."""
+    with tracing.span("multiworker.preload"):
+        inference.load_model(base_model=opts["base_model"], lora_dir=opts["lora_dir"])
+        get_embedder()
+        index_path, meta_path = collection_paths(opts["collection"])
+        if os.path.exists(index_path):
+            load_index(index_path, meta_path)
+
+
+def run_workers(topics: List[str], workers: int = WORKERS, top_k: int = 5, save: bool = True,
+                lora_dir: Optional[str] = None, collection: Optional[str] = None, share: bool = True,
+                base_model: Optional[str] = None) -> dict:
+    """
+    Generate guides for `topics` with `workers` processes. share=True preloads in this process
+    and forks (weights shared copy-on-write); share=False is the naive baseline where every
+    spawned worker calls load_model itself. Returns guides in topic order plus a memory report.
+    """
+    if inference.DEVICE != "cpu":
+        raise RuntimeError("multi-worker generation is CPU only; use generate_study_guides on GPU")
+    workers = max(1, min(workers, len(topics)))
+    opts = {"top_k": top_k, "save": save, "collection": collection,
+            "base_model": base_model or inference.BASE_MODEL, "lora_dir": lora_dir or inference.LORA_DIR,
+            "threads": max(1, runtime.budget("inference") // workers)}
+    t0 = time.perf_counter()
+    if share:
+        ctx = mp.get_context("fork")
+        _preload(opts)
+        # forked children would otherwise inherit (and fight over) the parent's Rayon pool
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        # move everything allocated so far out of the GC's reach: collections in the children
+        # would otherwise write to every object header and un-share those pages
+        gc.collect()
+        gc.freeze()
+    else:
+        ctx = mp.get_context("spawn")
+    load_s = time.perf_counter() - t0
+
+    tasks, results, release = ctx.Queue(), ctx.Queue(), ctx.Event()
+    for item in enumerate(topics):
+        tasks.put(item)
+    for _ in range(workers):
+        tasks.put(None)
+    procs = [ctx.Process(target=_worker, args=(w, tasks, results, release, opts), daemon=True) for w in range(workers)]
+    for p in procs:
+        p.start()
+
+    guides, errors, per_worker = [None] * len(topics), {}, {}
+    try:
+        while len(per_worker) < workers:
+            kind, wid, a, b, c = results.get(timeout=RESULT_TIMEOUT_S)
+            if kind == "result":
+                guides[a] = b
+                if c:
+                    errors[topics[a]] = c
+            else:
+                per_worker[wid] = dict(b, worker=wid, pid=c, topics=a)
+    except queue.Empty:
+        errors["_workers"] = f"no progress for {RESULT_TIMEOUT_S}s"
+    finally:
+        parent_mem = memory_mb()
+        release.set()
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        if share:
+            gc.unfreeze()
+    wall = time.perf_counter() - t0
+
+    rows = [per_worker[w] for w in sorted(per_worker)]
+    report = {
+        "mode": "shared" if share else "naive",
+        "workers": workers,
+        "threads_per_worker": opts["threads"],
+        "topics": len(topics),
+        "wall_s": wall,
+        "load_s": load_s,
+        "guides_per_s": len(topics) / wall if wall else 0.0,
+        "parent": parent_mem,
+        "per_worker": rows,
+        # PSS counts shared pages once across processes, so this is the real footprint
+        "total_pss_mb": parent_mem["pss_mb"] + sum(r["pss_mb"] for r in rows),
+        "total_rss_mb": parent_mem["rss_mb"] + sum(r["rss_mb"] for r in rows),
+    }
+    return {"guides": guides, "errors": errors, "report": report}
+
+
+def print_report(report: dict):
+    print(f"[{report['mode']}] {report['workers']} workers x {report['threads_per_worker']} threads: "
+          f"{report['topics']} topics in {report['wall_s']:.1f}s ({report['guides_per_s']:.2f} guides/s, "
+          f"setup {report['load_s']:.1f}s)")
+    p = report["parent"]
+    print(f"  parent   rss={p['rss_mb']:8.1f}MB pss={p['pss_mb']:8.1f}MB")
+    for r in report["per_worker"]:
+        print(f"  worker {r['worker']} rss={r['rss_mb']:8.1f}MB pss={r['pss_mb']:8.1f}MB "
+              f"private={r['private_mb']:8.1f}MB shared={r['shared_mb']:8.1f}MB topics={r['topics']}")
+    print(f"  total    pss={report['total_pss_mb']:8.1f}MB (sum of rss {report['total_rss_mb']:.1f}MB)")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Generate study guides with several workers sharing one model copy.")
+    ap.add_argument("topics", nargs="+")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--lora-dir", default=None)
+    ap.add_argument("--collection", default=None)
+    ap.add_argument("--no-save", action="store_true")
+    ap.add_argument("--compare", action="store_true", help="also run the naive per-worker-load baseline")
+    args = ap.parse_args()
+    kw = dict(workers=args.workers, top_k=args.top_k, save=not args.no_save, lora_dir=args.lora_dir,
+              collection=args.collection)
+    runs = [run_workers(args.topics, share=True, **kw)]
+    if args.compare:
+        runs.append(run_workers(args.topics, share=False, **kw))
+    for run in runs:
+        print_report(run["report"])
+        for topic, err in run["errors"].items():
+            print(f"  ❌ {topic}: {err}")
+    if args.compare:
+        shared, naive = runs[0]["report"], runs[1]["report"]
+        print(f"Shared weights save {naive['total_pss_mb'] - shared['total_pss_mb']:.1f}MB "
+              f"({1 - shared['total_pss_mb'] / naive['total_pss_mb']:.0%}) of total PSS vs naive")
@@ -60,3 +60,57 @@ def build_prompt(topic: str, context: str) -> str:
         "}\n"
     )
     return prompt
+
+
+# -----------------------
+# Shared compact template (training + inference)
+# -----------------------
+# fine_tune.py trains on format_example() and inference uses build_compact_prompt(), so the
+# model sees the same layout and instruction text in both places: training rows get their
+# instruction rebuilt from INSTRUCTION_TEMPLATE with the topic of their output JSON (see
+# training_instruction). Loss is only taken on the completion.
+TEMPLATE_ID = "compact-v2"     # bump whenever the layout below changes (invalidates tokenized cache)
+RESPONSE_MARKER = "<<<BEGIN_JSON>>>"
+INSTRUCTION_TEMPLATE = "Write a JSON study guide for the topic: {topic}"
+
+
+def build_prompt_prefix(instruction: str, context: str) -> str:
+    """Everything the model is conditioned on; the JSON completion follows directly after it."""
+    return f"{instruction.strip()}\n\n{context.strip()}\n\n{RESPONSE_MARKER}\n"
+
+
+def training_instruction(instruction: str, output) -> str:
+    """
+    The instruction inference would use for this example: INSTRUCTION_TEMPLATE with the
+    output's "topic". Rows whose output has no parseable topic keep their own instruction.
+    """
+    try:
+        data = json.loads(output) if isinstance(output, str) else output
+        topic = data.get("topic") if isinstance(data, dict) else None
+    except ValueError:
+        topic = None
+    if isinstance(topic, str) and topic.strip():
+        return INSTRUCTION_TEMPLATE.format(topic=topic.strip())
+    return instruction
+
+
+def format_example(instruction: str, inp: str, output: str):
+    """Split a training example into (prompt, completion) using the shared layout."""
+    return build_prompt_prefix(training_instruction(instruction, output), inp), output.strip()
+
+
+def build_compact_prompt(topic: str, context: str) -> str:
+    """Inference prompt matching the training layout (much shorter than build_prompt)."""
+    return build_prompt_prefix(INSTRUCTION_TEMPLATE.format(topic=topic), context)
+
+
+def fit_context(tokenizer, context: str, max_tokens: int) -> str:
+    """
+    Cut `context` to at most max_tokens tokens, dropping its end (the lowest-ranked chunks).
+    Trimming the context instead of the finished prompt keeps the instruction and the
+    response marker, like the middle cut in fine_tune.tokenize_example.
+    """
+    ids = tokenizer(context, add_special_tokens=False)["input_ids"]
+    if len(ids) <= max_tokens:
+        return context
+    return tokenizer.decode(ids[:max(0, max_tokens)])
@@ -0,0 +1,255 @@
+# src/render.py
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# CONFIG
+OUTPUTS_DIR = "outputs"
+MANIFEST_NAME = ".render_manifest.json"
+RENDER_VERSION = "1"       # bump when the rendered format changes (forces a full re-render)
+WRAP_WIDTH = 90
+
+
+# -----------------------
+# raw (unstructured) model output cleanup
+# -----------------------
+def clean_repeated_filenames(text: str) -> str:
+    """
+    Replace repeated occurrences of filenames like 'Something.pdf Something.pdf ...'
+    with just a single filename.
+    """
+    # collapse runs like "X.pdf X.pdf X.pdf" -> "X.pdf"
+    text = re.sub(r'(\b[\w\-\.\(\)]+\.pdf\b)(?:\s+\1)+', r'\1', text)
+    return text
+
+def collapse_repeated_lines(text: str) -> str:
+    """
+    Remove consecutive duplicate lines (often caused by bad OCR or model echo).
+    """
+    lines = text.splitlines()
+    out_lines = []
+    prev = None
+    for ln in lines:
+        ln_stripped = ln.strip()
+        if ln_stripped == prev:
+            # skip exact duplicate
+            continue
+        out_lines.append(ln)
+        prev = ln_stripped
+    return "\n".join(out_lines)
+
+def normalize_whitespace(text: str) -> str:
+    # Convert Windows newlines, remove leading/trailing whitespace on each line
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    # remove repeated blank lines (more than 2 -> 2)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    # trim spaces at line ends
+    text = "\n".join([ln.rstrip() for ln in text.splitlines()])
+    return text.strip()
+
+def wrap_paragraphs(text: str, width: int = WRAP_WIDTH) -> str:
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    wrapped = []
+    for p in paragraphs:
+        wrapped.append(textwrap.fill(p, width=width))
+    return "\n\n".join(wrapped)
+
+def raw_to_readable(raw: str) -> str:
+    t = raw
+    t = clean_repeated_filenames(t)
+    t = collapse_repeated_lines(t)
+    t = normalize_whitespace(t)
+    t = wrap_paragraphs(t)
+    return t
+
+
+# -----------------------
+# rendering
+# -----------------------
+def is_structured(data) -> bool:
+    return isinstance(data, dict) and any(k in data for k in ("topic", "summary", "key_points"))
+
+def structured_to_md(data: dict, default_title: str = "Untitled") -> str:
+    """Markdown for a schema-shaped study guide (missing fields are simply skipped)."""
+    topic = data.get("topic") or default_title
+    md_lines = [f"# {topic}\n"]
+    if data.get("summary"):
+        md_lines.append("## Summary\n")
+        md_lines.append(str(data["summary"]).strip() + "\n")
+    if data.get("key_points"):
+        md_lines.append("## Key points\n")
+        for kp in data["key_points"]:
+            md_lines.append(f"- {kp}")
+        md_lines.append("")
+    if data.get("formulas"):
+        md_lines.append("## Formulas\n")
+        for f in data["formulas"]:
+            latex = f.get("latex","")
+            name = f.get("name","")
+            meaning = f.get("meaning","")
+            units = f.get("units","")
+            md_lines.append(f"- **{name}** `{latex}` — {meaning} [{units}]")
+        md_lines.append("")
+    if data.get("important_questions"):
+        md_lines.append("## Important questions\n")
+        for q in data["important_questions"]:
+            md_lines.append(f"- Q: {q.get('q')}")
+            md_lines.append(f"  - Why important: {q.get('why_important')}")
+            md_lines.append(f"  - Difficulty: {q.get('difficulty')}\n")
+    if data.get("solved_examples"):
+        md_lines.append("## Solved examples\n")
+        for ex in data["solved_examples"]:
+            md_lines.append(f"### {ex.get('question')}\n")
+            for i, s in enumerate(ex.get("solution_steps", []), 1):
+                md_lines.append(f"{i}. {s}")
+            md_lines.append(f"**Final answer:** {ex.get('final_answer')}\n")
+    md = "\n".join(md_lines).strip()
+    return re.sub(r'\n{2,}', '\n\n', md)
+
+def render(data, title: str):
+    """Return (readable_txt, markdown) for one parsed output JSON."""
+    if is_structured(data):
+        md = structured_to_md(data, default_title=title)
+        return md, md
+    if isinstance(data, dict):
+        raw_text = data.get("raw_output") or data.get("output") or json.dumps(data, ensure_ascii=False)
+    else:
+        raw_text = json.dumps(data, ensure_ascii=False)
+    txt = raw_to_readable(raw_text)
+    # create a simple markdown wrapper
+    return txt, f"# {title}\n\n" + txt
+
+
+# -----------------------
+# files, manifest, parallel driver
+# -----------------------
+def output_paths(infile: Path):
+    return infile.with_name(infile.stem + "_readable.txt"), infile.with_name(infile.stem + ".md")
+
+# os.umask can only be read by setting it; do it once at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def atomic_write(path: Path, content: str):
+    """
+    Write via a temp file in the same directory + os.replace, so readers never see partial files.
+    The result keeps the existing file's mode (or the umask default for new files) rather than
+    mkstemp's owner-only 0600.
+    """
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix="." + path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def source_hash(path: Path) -> str:
+    h = hashlib.sha256(RENDER_VERSION.encode("utf-8"))
+    h.update(path.read_bytes())
+    return h.hexdigest()
+
+def render_file(infile, digest: str = None):
+    """Render one JSON file to <stem>_readable.txt and <stem>.md. Returns (infile, digest, error)."""
+    infile = Path(infile)
+    try:
+        data = json.loads(infile.read_text(encoding="utf-8"))
+        txt, md = render(data, infile.stem)
+        out_txt, out_md = output_paths(infile)
+        atomic_write(out_txt, txt + "\n")
+        atomic_write(out_md, md + "\n")
+        return str(infile), digest or source_hash(infile), None
+    except Exception as e:
+        return str(infile), None, f"{type(e).__name__}: {e}"
+
+def _load_manifest(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def render_all(files, manifest_path=None, workers=None, force=False):
+    """
+    Render many output JSON files. Files whose content hash matches the manifest entry (and whose
+    outputs still exist) are skipped; the rest are rendered in a process pool.
+    Returns {"rendered": [...], "skipped": [...], "failed": {path: error}}.
+    """
+    files = [Path(f) for f in files if not Path(f).name.startswith(".")]
+    if manifest_path is None:
+        # one manifest per tree, next to the files being rendered (outputs/ by default)
+        parents = [str(f.parent) for f in files] or [OUTPUTS_DIR]
+        manifest_path = Path(os.path.commonpath(parents)) / MANIFEST_NAME
+    manifest_path = Path(manifest_path)
+    manifest = {} if force else _load_manifest(manifest_path)
+
+    def key(path):
+        # manifest entries are relative to the manifest, so cwd / abs-vs-rel paths don't matter
+        return os.path.relpath(str(path), str(manifest_path.parent))
+
+    todo, skipped = [], []
+    for f in files:
+        digest = source_hash(f)
+        if manifest.get(key(f)) == digest and all(p.exists() for p in output_paths(f)):
+            skipped.append(str(f))
+        else:
+            todo.append((f, digest))
+
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_file, [f for f, _ in todo], [d for _, d in todo],
+                                    chunksize=max(1, len(todo) // 64)))
+    else:
+        results = [render_file(f, d) for f, d in todo]
+
+    rendered, failed = [], {}
+    for path, digest, err in results:
+        if err:
+            failed[path] = err
+            manifest.pop(key(path), None)
+        else:
+            rendered.append(path)
+            manifest[key(path)] = digest
+    if todo:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+    return {"rendered": rendered, "skipped": skipped, "failed": failed}
+
+def expand(patterns):
+    """Expand CLI args (files, directories or globs) into sorted .json paths."""
+    files = []
+    for arg in patterns:
+        if os.path.isdir(arg):
+            files.extend(glob.glob(os.path.join(arg, "**", "*.json"), recursive=True))
+        else:
+            files.extend(glob.glob(arg, recursive=True))
+    return sorted({f for f in files if f.endswith(".json")})
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Render generated study-guide JSON to Markdown and readable text.")
+    ap.add_argument("paths", nargs="*", default=[OUTPUTS_DIR], help="files, directories or globs (default: outputs/)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--force", action="store_true", help="ignore the manifest and re-render everything")
+    args = ap.parse_args()
+    files = expand(args.paths)
+    if not files:
+        sys.exit(f"No files found for: {args.paths}")
+    res = render_all(files, workers=args.workers, force=args.force)
+    print(f"Rendered {len(res['rendered'])}, skipped {len(res['skipped'])} unchanged, failed {len(res['failed'])}")
+    for path, err in res["failed"].items():
+        print(f"  ❌ {path}: {err}")
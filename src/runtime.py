@@ -0,0 +1,116 @@
+# src/runtime.py
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+# CONFIG
+# Per-stage CPU thread budgets. Every library a stage uses (torch intra-op, FAISS OpenMP,
+# the HF fast tokenizer's Rayon pool, tesseract's OpenMP) gets the stage's budget instead of
+# its own "all cores" default, so overlapping stages don't oversubscribe the machine.
+# Resolution order: CHEEBO_THREADS="ingest=2,index=4" > RUNTIME_PATH (written by
+# `python -m scripts.tune_threads --write`) > DEFAULT_SHARES of os.cpu_count().
+THREADS_ENV = "CHEEBO_THREADS"
+RUNTIME_PATH = "data/runtime.json"
+STAGES = ("ingest", "index", "inference")
+DEFAULT_SHARES = {
+    "ingest": 0.25,       # tesseract scales poorly past a few threads per page
+    "index": 0.5,
+    "inference": 1.0,
+}
+
+_LOCK = threading.RLock()
+_BUDGETS: Dict[str, int] = {}
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on (respects taskset / cgroup affinity where available)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _parse_env(value: str) -> Dict[str, int]:
+    out = {}
+    for part in value.split(","):
+        if "=" in part:
+            stage, n = part.split("=", 1)
+            out[stage.strip()] = int(n)
+    return out
+
+
+def load_budgets(path: str = RUNTIME_PATH) -> Dict[str, int]:
+    """Resolve the thread budget of every stage (see CONFIG for precedence)."""
+    cpus = cpu_count()
+    budgets = {s: max(1, int(cpus * DEFAULT_SHARES[s])) for s in STAGES}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            budgets.update({k: int(v) for k, v in json.load(f).get("threads", {}).items()})
+    budgets.update(_parse_env(os.environ.get(THREADS_ENV, "")))
+    return {s: max(1, min(n, cpus)) for s, n in budgets.items()}
+
+
+def budget(stage: str) -> int:
+    with _LOCK:
+        if not _BUDGETS:
+            _BUDGETS.update(load_budgets())
+        return _BUDGETS.get(stage, 1)
+
+
+def set_budget(stage: str, threads: int):
+    with _LOCK:
+        if not _BUDGETS:
+            _BUDGETS.update(load_budgets())
+        _BUDGETS[stage] = max(1, int(threads))
+
+
+def _apply(n: int) -> dict:
+    """Apply `n` threads to every loaded library; returns the previous settings for _restore."""
+    prev = {"env": {k: os.environ.get(k) for k in ("OMP_THREAD_LIMIT", "RAYON_NUM_THREADS", "TOKENIZERS_PARALLELISM")}}
+    # tesseract runs as a subprocess per call and reads OMP_THREAD_LIMIT from its environment
+    os.environ["OMP_THREAD_LIMIT"] = str(n)
+    # the tokenizers Rayon pool is sized once, on its first parallel call in this process
+    os.environ["RAYON_NUM_THREADS"] = str(n)
+    os.environ["TOKENIZERS_PARALLELISM"] = "true" if n > 1 else "false"
+    # only touch libraries the stage already imported; importing torch just to configure it
+    # would cost ingest ~1s and a few hundred MB
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        prev["torch"] = torch.get_num_threads()
+        torch.set_num_threads(n)
+    faiss = sys.modules.get("faiss")
+    if faiss is not None:
+        prev["faiss"] = faiss.omp_get_max_threads()
+        faiss.omp_set_num_threads(n)
+    return prev
+
+
+def _restore(prev: dict):
+    for k, v in prev["env"].items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    if "torch" in prev:
+        sys.modules["torch"].set_num_threads(prev["torch"])
+    if "faiss" in prev:
+        sys.modules["faiss"].omp_set_num_threads(prev["faiss"])
+
+
+@contextmanager
+def stage_threads(stage: str):
+    """
+    Run a block under `stage`'s thread budget and restore the previous settings afterwards.
+    The settings are process-wide: nested stages (e.g. retrieval inside generation) take the
+    inner budget for their duration.
+    """
+    n = budget(stage)
+    with _LOCK:
+        prev = _apply(n)
+    try:
+        yield n
+    finally:
+        with _LOCK:
+            _restore(prev)
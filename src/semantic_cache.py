@@ -0,0 +1,113 @@
+# src/semantic_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from src import tracing
+
+# CONFIG
+SIM_THRESHOLD = 0.88     # cosine similarity above which two topics count as the same request
+TTL_S = 6 * 3600         # entries older than this are ignored and dropped
+MAX_ENTRIES = 2048
+NEIGHBOURS = 8           # nearest cached topics checked per lookup (scope may differ)
+
+
+class SemanticCache:
+    """
+    Retrieval results (and optionally generated guides, per `variant` such as the LoRA
+    adapter that produced them) keyed by topic *meaning*.
+    Topic embeddings live in an in-memory inner-product FAISS index over L2-normalized
+    vectors, so a lookup is one tiny ANN search. An entry only matches lookups with the same
+    `scope` (index file + version, filters), so rebuilding an index invalidates its entries.
+    Eviction is LRU beyond `max_entries` plus a TTL checked on lookup.
+    """
+
+    def __init__(self, threshold: float = SIM_THRESHOLD, ttl_s: float = TTL_S, max_entries: int = MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._index = None               # faiss.IndexIDMap2(IndexFlatIP), created on first add
+        self._entries = OrderedDict()    # id -> {"key", "topic", "scope", "ids", "guides", "ts"}
+        self._next_id = 0
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "guide_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _normalize(emb: np.ndarray) -> np.ndarray:
+        v = np.array(emb, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(v)
+        return v
+
+    def _remove_locked(self, ids):
+        if ids:
+            self._index.remove_ids(np.array(ids, dtype=np.int64))
+            for i in ids:
+                self._entries.pop(i, None)
+
+    def lookup(self, emb: np.ndarray, scope, guide_variant=None) -> Optional[dict]:
+        """
+        Most similar live entry with the same scope above the threshold, or None.
+        The returned copy has "guide" set to the cached guide for `guide_variant` (or None).
+        """
+        with self.lock:
+            self.stats["lookups"] += 1
+            hit = None
+            if self._entries:
+                D, I = self._index.search(self._normalize(emb), min(NEIGHBOURS, len(self._entries)))
+                now, expired = time.time(), []
+                for sim, i in zip(D[0], I[0]):
+                    e = self._entries.get(int(i))
+                    if e is None:
+                        continue
+                    if now - e["ts"] > self.ttl_s:
+                        expired.append(int(i))
+                    elif hit is None and sim >= self.threshold and e["scope"] == scope:
+                        hit = dict(e, similarity=float(sim), guide=e["guides"].get(guide_variant))
+                        self._entries.move_to_end(int(i))
+                self.stats["expired"] += len(expired)
+                self._remove_locked(expired)
+            if hit is None:
+                self.stats["misses"] += 1
+                tracing.count("semantic_cache_miss")
+            else:
+                self.stats["hits"] += 1
+                tracing.count("semantic_cache_hit")
+                if hit["guide"] is not None:
+                    self.stats["guide_hits"] += 1
+            return hit
+
+    def add(self, emb: np.ndarray, topic: str, scope, ids) -> int:
+        """Cache retrieval `ids` for `topic`; returns the entry key (see set_guide)."""
+        v = self._normalize(emb)
+        with self.lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(v.shape[1]))
+            key = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(v, np.array([key], dtype=np.int64))
+            self._entries[key] = {"key": key, "topic": topic, "scope": scope, "ids": list(ids),
+                                  "guides": {}, "ts": time.time()}
+            overflow = list(self._entries)[:max(0, len(self._entries) - self.max_entries)]
+            self.stats["evictions"] += len(overflow)
+            self._remove_locked(overflow)
+            return key
+
+    def set_guide(self, key: int, guide: dict, variant=None):
+        with self.lock:
+            if key in self._entries:
+                self._entries[key]["guides"][variant] = guide
+
+    def clear(self):
+        with self.lock:
+            self._index = None
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        with self.lock:
+            out = dict(self.stats, entries=len(self._entries))
+        out["hit_rate"] = out["hits"] / out["lookups"] if out["lookups"] else 0.0
+        return out
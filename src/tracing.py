@@ -0,0 +1,142 @@
+# src/tracing.py
+import contextvars
+import cProfile
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# CONFIG
+# Tracing is off unless CHEEBO_TRACE=<path.jsonl> is set (or enable() is called).
+# CHEEBO_PROFILE=<path.prof> additionally runs root spans under cProfile.
+TRACE_ENV = "CHEEBO_TRACE"
+PROFILE_ENV = "CHEEBO_PROFILE"
+
+_STATE = {"path": os.environ.get(TRACE_ENV) or None, "profile": os.environ.get(PROFILE_ENV) or None}
+_LOCK = threading.Lock()
+_CURRENT = contextvars.ContextVar("cheebo_span", default=None)
+
+
+def enable(path: str, profile_path: str = None):
+    """Turn tracing on, appending JSONL records to `path`."""
+    _STATE["path"] = path
+    _STATE["profile"] = profile_path
+
+
+def disable():
+    _STATE["path"] = None
+    _STATE["profile"] = None
+
+
+def enabled() -> bool:
+    return _STATE["path"] is not None
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "parent_id", "attrs", "counters", "start", "_token", "_prof")
+
+    def __init__(self, name, attrs):
+        parent = _CURRENT.get()
+        self.parent = parent
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.counters = {}
+        self._prof = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _CURRENT.set(self)
+        if self.parent_id is None and _STATE["profile"]:
+            self._prof = cProfile.Profile()
+            self._prof.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur = time.perf_counter() - self.start
+        if self._prof is not None:
+            self._prof.disable()
+            self._prof.dump_stats(_STATE["profile"])
+        _CURRENT.reset(self._token)
+        record = {
+            "type": "span",
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "ts": time.time() - dur,
+            "dur_ms": dur * 1000,
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if self.counters:
+            record["counters"] = self.counters
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _write(record)
+        return False
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled so instrumented code costs one attribute check."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """Context manager timing a pipeline stage; nests under the enclosing span."""
+    if _STATE["path"] is None:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def count(name: str, n: int = 1):
+    """Add `n` to a counter on the current span and on every enclosing span."""
+    if _STATE["path"] is None:
+        return
+    s = _CURRENT.get()
+    while s is not None:
+        s.counters[name] = s.counters.get(name, 0) + n
+        s = s.parent
+
+
+def _write(record):
+    path = _STATE["path"]
+    if path is None:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _LOCK:
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def profiled(path: str):
+    """cProfile a block and dump stats to `path` (view with snakeviz / pstats)."""
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        prof.dump_stats(path)